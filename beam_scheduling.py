@@ -3,279 +3,335 @@
 #  (c) 2013 Ivan R. Judson / Montana State University
 #
 
-import pprint
-
-def greedy1(network):
-    for sub in network.subscribers:
-        network.node[sub]['preferred_relay'] = None
-
-    for r in network.relays:
-        vv = dict()
-        relay = network.node[r]
-        relay['allocated_channels'] = 0
-        for sub in network.subscribers:
-            subscriber = network.node[sub]
-            spr = network.node[sub]['preferred_relay']
-            ql = network.node[sub]['queue_length']
-            rtput = ql * min(ql, 
-                             network.throughput(r, sub, 
-                                theta=network.theta) * network.slot_length)
-            if spr is None:
-                vv[sub] = rtput
-            else:
-                vv[sub] = rtput - ql * min(ql, network.throughput(spr, sub, theta=network.theta) * network.slot_length)
-
-        allocated_channels = 0
-        for s in sorted(vv, key=vv.get, reverse=True):
-            if vv[s] > 0.0 and allocated_channels < network.channels:
-                network.node[s]['preferred_relay'] = r
-                allocated_channels += 1
-
-    # Find beam sets
-    for r in network.relays:
+import itertools
+
+import numpy
+import scipy.sparse
+
+import profiling
+from network import tier_throughput
+from milp import Problem, get_backend
+
+class BeamSchedule:
+    """
+    Array view of a network for beam scheduling: relays and subscribers
+    in a fixed order, the per-slot capacity of every relay-subscriber
+    pair and, for each relay, a beamset x subscriber membership matrix.
+    It only depends on geometry and beamsets, so it can be reused while
+    queue lengths change.
+    """
+
+    @profiling.profiled('greedy.schedule')
+    def __init__(self, network):
+        self.relays = list(network.relays)
+        self.subscribers = list(network.subscribers)
+        self.channels = network.channels
+        tiers = network.geometry.tier_block(self.relays, self.subscribers, network.theta)
+        self.capacity = numpy.take(tier_throughput, tiers) * network.slot_length
+        column = numpy.zeros(len(network.geometry.positions), dtype=numpy.intp)
+        column[self.subscribers] = numpy.arange(len(self.subscribers))
+        self.bearings = list()
+        self.members = list()
+        for r in self.relays:
+            beamsets = list(network.beamset[r].values())
+            sizes = [len(subscribers) for subscribers in beamsets]
+            flat = numpy.fromiter(itertools.chain.from_iterable(beamsets),
+                                  dtype=numpy.intp, count=sum(sizes))
+            members = numpy.zeros((len(beamsets), len(self.subscribers)), dtype=bool)
+            members[numpy.repeat(numpy.arange(len(beamsets)), sizes), column[flat]] = True
+            self.bearings.append(list(network.beamset[r].keys()))
+            self.members.append(members)
+        # Float copies for the per-slot dot products, which would otherwise
+        # convert the boolean matrices on every call
+        self.coverage = [members.astype(float) for members in self.members]
+
+    def queue_lengths(self, network):
+        return numpy.array([network.node[s]['queue_length'] for s in self.subscribers])
+
+    def utility(self, queue_lengths):
+        "Value ql * min(ql, capacity) of serving each subscriber from each relay."
+        return queue_lengths * numpy.minimum(queue_lengths, self.capacity)
+
+def _top(values, count):
+    "Indices of the (at most count) largest positive values."
+    if count < len(values):
+        candidates = (-values).argpartition(count - 1)[:count]
+    else:
+        candidates = numpy.arange(len(values))
+    return candidates[values[candidates] > 0.0]
+
+def _best_beamset(schedule, weights, i):
+    """
+    Index and value of relay i's best beamset, the last one on ties, given
+    the weight of every subscriber to it.
+    """
+    coverage = schedule.coverage[i]
+    if len(coverage) == 0:
+        return None, 0.0
+    values = coverage.dot(weights)
+    best = len(values) - 1 - int(values[::-1].argmax())
+    return best, float(values[best])
+
+def _covered(schedule, best):
+    "Relay x subscriber matrix of who each relay's chosen beamset covers."
+    covered = numpy.zeros(schedule.capacity.shape, dtype=bool)
+    for i, l in enumerate(best):
+        if l is not None:
+            covered[i] = schedule.members[i][l]
+    return covered
+
+def _claim(schedule, utility, preferred, current, i):
+    """
+    Let relay i claim the subscribers it improves on the most. current
+    holds the utility of every subscriber's preferred relay (0 for none)
+    and is kept up to date.
+    """
+    claimed = _top(utility[i] - current, schedule.channels)
+    preferred[claimed] = i
+    current[claimed] = utility[i, claimed]
+
+def _fill(schedule, utility, preferred, covered, allocated):
+    "Give unassigned subscribers the best covering relay with a free channel."
+    values = numpy.where(covered, utility, 0.0)
+    candidates = numpy.flatnonzero((preferred < 0) & (values > 0.0).any(axis=0))
+    if len(candidates) == 0:
+        return
+    # Rank the relays of every candidate at once; the walk below is over
+    # a few small ints, where per-subscriber numpy calls would dominate
+    values = values[:, candidates]
+    orders = numpy.argsort(-values, axis=0, kind='stable')
+    positive = values[orders, numpy.arange(len(candidates))] > 0.0
+    channels = schedule.channels
+    counts = allocated.tolist()
+    full = sum(1 for count in counts if count >= channels)
+    for k, order, ok in zip(candidates.tolist(), orders.T.tolist(), positive.T.tolist()):
+        if full == len(counts):
+            break
+        for r, p in zip(order, ok):
+            if p and counts[r] < channels:
+                preferred[k] = r
+                counts[r] += 1
+                full += counts[r] == channels
+                break
+    allocated[:] = counts
+
+def schedule_greedy(schedule, queue_lengths, variant=1):
+    """
+    Run greedy heuristic 1 or 2 on arrays. Returns the objective, the
+    preferred relay index of every subscriber (-1 for none), the chosen
+    (beamset index, value) of every relay, the allocated channels and the
+    indices of the subscribers that end up served.
+    """
+    with profiling.span('greedy.utility', variant=variant):
+        utility = schedule.utility(queue_lengths)
+    relays = len(schedule.relays)
+    preferred = numpy.full(len(schedule.subscribers), -1, dtype=numpy.intp)
+    current = numpy.zeros(len(schedule.subscribers))
+    best = [(None, 0.0)] * relays
+
+    if variant == 1:
+        with profiling.span('greedy.claim', variant=variant):
+            for i in range(relays):
+                _claim(schedule, utility, preferred, current, i)
+        with profiling.span('greedy.beamsets', variant=variant):
+            # Row i weighs the subscribers relay i claimed
+            weights = numpy.where(preferred == numpy.arange(relays)[:, None], utility, 0.0)
+            best = [_best_beamset(schedule, weights[i], i) for i in range(relays)]
+    else:
+        with profiling.span('greedy.claim', variant=variant):
+            for i in range(relays):
+                _claim(schedule, utility, preferred, current, i)
+                best[i] = _best_beamset(schedule, numpy.where(preferred == i, utility[i], 0.0), i)
+
+    covered = _covered(schedule, [l for l, value in best])
+    allocated = numpy.zeros(relays, dtype=numpy.intp)
+    if variant == 1:
+        with profiling.span('greedy.drop', variant=variant):
+            assigned = numpy.flatnonzero(preferred >= 0)
+            keep = covered[preferred[assigned], assigned]
+            preferred[assigned[~keep]] = -1
+            allocated += numpy.bincount(preferred[assigned[keep]], minlength=relays)
+
+    with profiling.span('greedy.fill', variant=variant):
+        _fill(schedule, utility, preferred, covered, allocated)
+
+    served = numpy.flatnonzero(preferred >= 0)
+    served = served[covered[preferred[served], served]]
+    objective = float(utility[preferred[served], served].sum())
+    return objective, preferred, best, allocated, served
+
+@profiling.profiled('greedy.apply')
+def _apply(network, schedule, preferred, best, allocated, served, connect=True):
+    "Record a schedule on the network's nodes and connect served pairs."
+    for i, r in enumerate(schedule.relays):
         relay = network.node[r]
-        relay['allocated_channels'] = 0
-        best_beamset_value = 0.0
-        for bearing,subscribers in network.beamset[r].items():
-            beamset_value = 0.0
-            for sub in subscribers:
-                subscriber = network.node[sub]
-                if subscriber['preferred_relay'] == r:
-                    ql = subscriber['queue_length']
-                    beamset_value += ql * min(ql, network.throughput(r, sub, network.theta) * network.slot_length)
-            if beamset_value >= best_beamset_value:
-                relay['best_bearing'] = (bearing, beamset_value)
-                best_beamset_value = beamset_value
-
-    for s in network.subscribers:
-        if network.node[s]['preferred_relay'] is not None:
-            r = network.node[s]['preferred_relay']
-            relay = network.node[r]
-            best_beamset = network.beamset[r][relay['best_bearing'][0]]
-            if s in best_beamset:
-                relay['allocated_channels'] += 1
-            else:
-                network.node[s]['preferred_relay'] = None
-
-    for s in network.subscribers:
-        subscriber = network.node[s]
-        if subscriber['preferred_relay'] is None:
-            vv = dict()
-            for r in network.relays:
-                relay = network.node[r]
-                beamset = network.beamset[r][relay['best_bearing'][0]]
-                if s in beamset:
-                    ql = subscriber['queue_length']
-                    vv[r] = ql * min(ql, network.throughput(r, s, network.theta) * network.slot_length)
-                else:
-                    vv[r] = 0.0
-                                          
-            for r in sorted(vv, key=vv.get, reverse=True):
-                value = vv[r]
-                relay = network.node[r]
-                if value > 0.0 and relay['allocated_channels'] < network.channels:
-                    subscriber['preferred_relay'] = r
-                    relay['allocated_channels'] += 1
-                    break
-
-
-    objective = 0.0
-    for s in network.subscribers:
-        subscriber = network.node[s]
-        if subscriber['preferred_relay'] is not None:
-            pri = subscriber['preferred_relay']
-            beamset = network.beamset[pri][network.node[pri]['best_bearing'][0]]
-            if s in beamset:
-                ql = subscriber['queue_length']
-                objective += ql * min(ql, network.throughput(pri, s, network.theta) * network.slot_length)
-                network.add_edge(pri, s)
-                network.init_edge(pri, s)
-
+        relay['allocated_channels'] = int(allocated[i])
+        l, value = best[i]
+        relay['best_bearing'] = None if l is None else (schedule.bearings[i][l], value)
+    for k, s in enumerate(schedule.subscribers):
+        i = preferred[k]
+        network.node[s]['preferred_relay'] = None if i < 0 else schedule.relays[i]
+
+    if connect:
+        for k in served:
+            r = schedule.relays[preferred[k]]
+            s = schedule.subscribers[k]
+            network.add_edge(r, s)
+            network.init_edge(r, s)
+
+def greedy1(network, schedule=None):
+    """
+    Greedy heuristic 1: every relay claims the subscribers it serves best,
+    then picks its most valuable beamset, drops the claimed subscribers
+    outside of it and finally hands leftover subscribers to covering
+    relays with free channels.
+    """
+    if schedule is None:
+        schedule = BeamSchedule(network)
+    objective, preferred, best, allocated, served = \
+        schedule_greedy(schedule, schedule.queue_lengths(network), variant=1)
+    _apply(network, schedule, preferred, best, allocated, served)
     return objective
 
-def greedy2(network):
-    for sub in network.subscribers:
-        network.node[sub]['preferred_relay'] = None
-
-    for r in network.relays:
-        vv = dict()
-        relay = network.node[r]
-        relay['allocated_channels'] = 0
-        for sub in network.subscribers:
-            subscriber = network.node[sub]
-            spr = network.node[sub]['preferred_relay']
-            ql = network.node[sub]['queue_length']
-            rtput = ql * min(ql, 
-                             network.throughput(r, sub, 
-                                theta=network.theta) * network.slot_length)
-            if spr is None:
-                vv[sub] = rtput
-            else:
-                vv[sub] = rtput - ql * min(ql, network.throughput(spr, sub, theta=network.theta) * network.slot_length)
-
-        allocated_channels = 0
-        for s in sorted(vv, key=vv.get, reverse=True):
-            if vv[s] > 0.0 and allocated_channels < network.channels:
-                network.node[s]['preferred_relay'] = r
-                allocated_channels += 1
-
-        # Find beam sets
-        relay['allocated_channels'] = 0
-        best_beamset_value = 0.0
-        for bearing,subscribers in network.beamset[r].items():
-            beamset_value = 0.0
-            for sub in subscribers:
-                subscriber = network.node[sub]
-                if subscriber['preferred_relay'] == r:
-                    ql = subscriber['queue_length']
-                    beamset_value += ql * min(ql, network.throughput(r, sub, network.theta) * network.slot_length)
-            if beamset_value >= best_beamset_value:
-                relay['best_bearing'] = (bearing, beamset_value)
-                best_beamset_value = beamset_value
-
-    for s in network.subscribers:
-        subscriber = network.node[s]
-        if subscriber['preferred_relay'] is None:
-            vv = dict()
-            for r in network.relays:
-                relay = network.node[r]
-                beamset = network.beamset[r][relay['best_bearing'][0]]
-                if s in beamset:
-                    ql = subscriber['queue_length']
-                    vv[r] = ql * min(ql, network.throughput(r, s, network.theta) * network.slot_length)
-                else:
-                    vv[r] = 0.0
-                                          
-            for r in sorted(vv, key=vv.get, reverse=True):
-                value = vv[r]
-                relay = network.node[r]
-                if value > 0.0 and relay['allocated_channels'] < network.channels:
-                    subscriber['preferred_relay'] = r
-                    relay['allocated_channels'] += 1
-                    break
-
-
-    objective = 0.0
-    for s in network.subscribers:
-        subscriber = network.node[s]
-        if subscriber['preferred_relay'] is not None:
-            pri = subscriber['preferred_relay']
-            beamset = network.beamset[pri][network.node[pri]['best_bearing'][0]]
-            if s in beamset:
-                ql = subscriber['queue_length']
-                objective += ql * min(ql, network.throughput(pri, s, network.theta) * network.slot_length)
-                network.add_edge(pri, s)
-                network.init_edge(pri, s)
-
+def greedy2(network, schedule=None):
+    """
+    Greedy heuristic 2: like greedy1, but each relay picks its beamset
+    right after claiming subscribers and claimed subscribers are not
+    dropped.
+    """
+    if schedule is None:
+        schedule = BeamSchedule(network)
+    objective, preferred, best, allocated, served = \
+        schedule_greedy(schedule, schedule.queue_lengths(network), variant=2)
+    _apply(network, schedule, preferred, best, allocated, served)
     return objective
 
-import cplex
-from cplex.exceptions import CplexSolverError
-
-def optimal(network):
-    r = dict()
-    THRESHOLD = 0.0001
-    model = cplex.Cplex()
-    model.set_problem_name("BS-RAP")
-
-    # Initialize y
-    names = ["y(%d)" % i for i in network.subscribers]
-    lb = [0.0] * len(names)
-    ub = [network.node[i]['queue_length'] for i in network.subscribers]
-    ty = [model.variables.type.continuous] * len(names)
-    model.variables.add(names=names, lb=lb, ub=ub, types=ty)
-
-    # Set the objective
-    coefficients = [(names.index("y(%d)" % i), network.node[i]['queue_length']) for i in network.subscribers]
-    model.objective.set_linear(coefficients)
-    model.objective.set_sense(model.objective.sense.maximize)
-
-    # 1. Initialize x
-    for i in network.relays:
-        r[i] = dict()
-        for j in network.subscribers:
-            r[i][j] = network.throughput(i, j, network.theta) * network.slot_length
-            model.variables.add(names=["x(%d)(%d)" % (i, j)], lb=[0], ub=[1], types=[model.variables.type.integer])
-            if r[i][j] < THRESHOLD:
-                model.linear_constraints.add(lin_expr=[["x(%d)(%d)" % (i,j)],[1.0]], rhs=[0], senses=["E"])
-
-    # 2. Initialize s
-    for i in network.relays:
-        for l in range(len(network.beamset[i])):
-            model.variables.add(names=["s(%d)(%d)" % (i, l)], lb=[0], ub=[1], types=[model.variables.type.integer])
-
-    # 3. Constraint 5
-    rows = list()
-    rhs = list()
-    senses = ""
-    for i in network.subscribers:
-        rows.append([["y(%d)" % i ], [1.0]])
-        rhs.append(network.node[i]['queue_length'])
-        senses += "L"
-    model.linear_constraints.add(lin_expr=rows, rhs=rhs, senses=senses)
-
-    # 4. Constraint 6
-    rows = list()
-    rhs = list()
-    senses = ""
-    for j in network.subscribers:
-        row = ["y(%d)" % j]
-        coefficients = [-1.0]
-        for i in network.relays:        
-            row.append("x(%d)(%d)" % (i,j))
-            coefficients.append(r[i][j])
-        rows.append([row, coefficients])
-        rhs.append(0.0)
-        senses += "L"
-    model.linear_constraints.add(lin_expr=rows, rhs=rhs, senses=senses)
-
-    # 5. Constraint 7
-    names = list()
-    for j in network.subscribers:
-        for i in network.relays:
-            names.append("x(%d)(%d)" % (i,j))
-    model.linear_constraints.add(lin_expr=[[names, [1.0] * len(names)]], rhs=[1.0], senses=["L"])
-
-    # 6. Constraint 8
-    names = list()
-    for i in network.relays:
-        for l in range(len(network.beamset[i])):
-            names.append("s(%d)(%d)" % (i, l))
-    model.linear_constraints.add(lin_expr=[[names, [1.0] * len(names)]], rhs=[1.0], senses=["E"])
-
-
-    # 7.  Constaint 9
-    rhs = list()
+def bsrap_problem(schedule, queue_lengths, threshold=0.0001, names=False):
+    """
+    BS-RAP as a MILP. Variables are y(j), the bits served to subscriber j,
+    x(i)(j), relay i serves subscriber j, and s(i)(l), relay i uses its
+    l-th beamset; the objective is to maximize sum ql(j) * y(j). The
+    constraint matrix is assembled in bulk from index arithmetic.
+    """
+    subscribers = len(schedule.subscribers)
+    relays = len(schedule.relays)
+    beams = [len(members) for members in schedule.members]
+    x_offset = subscribers
+    s_offset = subscribers + relays * subscribers + numpy.cumsum([0] + beams[:-1])
+    variables = subscribers + relays * subscribers + sum(beams)
+    capacity = schedule.capacity
+    relay_index = numpy.arange(relays)
+    subscriber_index = numpy.arange(subscribers)
+    x = x_offset + relay_index[:, None] * subscribers + subscriber_index[None, :]
+
+    objective = numpy.zeros(variables)
+    objective[:subscribers] = queue_lengths
+    lb = numpy.zeros(variables)
+    ub = numpy.ones(variables)
+    ub[:subscribers] = queue_lengths
+    ub[x[capacity < threshold]] = 0.0
+    integrality = numpy.ones(variables, dtype=numpy.int8)
+    integrality[:subscribers] = 0
+
     rows = list()
-    senses = ""
-    for i in network.relays:
-        for j in network.subscribers:
-            lhs = ["x(%d)(%d)" % (i,j)]
-            coefficients = [-1.0]
-            for l in range(len(network.beamset[i])):
-                if l in network.beamset[i] and j in network.beamset[i][l]:
-                    lhs.append("s(%d)(%d)" % (i, l))
-                    coefficients.append(1.0)
-            rows.append([lhs, coefficients])
-            rhs.append(0.0)
-            senses += "G"
-    model.linear_constraints.add(lin_expr=rows, rhs=rhs, senses=senses)
-
-    # 8. Constraint 10
-    names = list()
-    for i in network.relays:
-        for j in network.subscribers:
-            names.append("x(%d)(%d)" % (i,j))
-    model.linear_constraints.add(lin_expr=[[names, [1.0] * len(names)]], rhs=[network.channels], senses=["L"])
-
-    # Solve the problem, return the value    
-    try:
-#        model.write("bsrap.lp")
-        model.write("bsrap.mps")
-        model.set_results_stream(None)
-        model.solve()
-        return(model.solution.get_objective_value())
-    except CplexSolverError as e:
-        print("Exception raised during solve: ", e)
-    else:
-        print("Solved optimal solution.")
+    cols = list()
+    vals = list()
+    row_lb = list()
+    row_ub = list()
+    def add(row, col, val, lo, hi):
+        start = sum(len(bound) for bound in row_lb)
+        rows.append(start + numpy.asarray(row))
+        cols.append(numpy.asarray(col))
+        vals.append(numpy.broadcast_to(numpy.asarray(val, dtype=float), numpy.shape(col)))
+        row_lb.append(numpy.broadcast_to(numpy.asarray(lo, dtype=float), (len(hi),)))
+        row_ub.append(numpy.asarray(hi, dtype=float))
+
+    inf = numpy.inf
+    # Constraint 5: y(j) <= ql(j)
+    add(subscriber_index, subscriber_index, 1.0, -inf, queue_lengths)
+
+    # Constraint 6: y(j) <= sum_i r(i)(j) x(i)(j)
+    i, j = numpy.nonzero(capacity >= threshold)
+    add(numpy.concatenate((subscriber_index, j)),
+        numpy.concatenate((subscriber_index, x[i, j])),
+        numpy.concatenate((numpy.ones(subscribers), -capacity[i, j])),
+        -inf, numpy.zeros(subscribers))
+
+    # Constraint 7: every subscriber is served by at most one relay
+    add(numpy.tile(subscriber_index, relays), x.ravel(), 1.0, -inf, numpy.ones(subscribers))
+
+    # Constraint 8: every relay with beamsets points exactly one of them
+    with_beams = [k for k in range(relays) if beams[k] > 0]
+    add(numpy.repeat(numpy.arange(len(with_beams)), [beams[k] for k in with_beams]),
+        numpy.concatenate([s_offset[k] + numpy.arange(beams[k]) for k in with_beams] or [[]]).astype(numpy.intp),
+        1.0, numpy.ones(len(with_beams)), numpy.ones(len(with_beams)))
+
+    # Constraint 9: x(i)(j) <= sum of s(i)(l) over the beamsets l covering j
+    pair = relay_index[:, None] * subscribers + subscriber_index[None, :]
+    covering = [numpy.nonzero(members) for members in schedule.members]
+    add(numpy.concatenate([pair.ravel()] + [k * subscribers + c[1] for k, c in enumerate(covering)]),
+        numpy.concatenate([x.ravel()] + [s_offset[k] + c[0] for k, c in enumerate(covering)]).astype(numpy.intp),
+        numpy.concatenate([numpy.ones(relays * subscribers)] + [-numpy.ones(len(c[0])) for c in covering]),
+        -inf, numpy.zeros(relays * subscribers))
+
+    # Constraint 10: every relay serves at most channels subscribers
+    add(numpy.repeat(relay_index, subscribers), x.ravel(), 1.0,
+        -inf, numpy.full(relays, float(schedule.channels)))
+
+    row_lb = numpy.concatenate(row_lb)
+    matrix = scipy.sparse.coo_matrix(
+        (numpy.concatenate(vals), (numpy.concatenate(rows), numpy.concatenate(cols))),
+        shape=(len(row_lb), variables)).tocsr()
+
+    variable_names = None
+    if names:
+        variable_names = ["y(%d)" % s for s in schedule.subscribers]
+        variable_names += ["x(%d)(%d)" % (r, s) for r in schedule.relays for s in schedule.subscribers]
+        variable_names += ["s(%d)(%d)" % (r, l) for k, r in enumerate(schedule.relays)
+                           for l in range(beams[k])]
+    return Problem(objective, matrix, row_lb, numpy.concatenate(row_ub), lb, ub,
+                   integrality, maximize=True, name="BS-RAP", names=variable_names)
+
+def bsrap_solution(schedule, x):
+    """
+    Decode a solution vector of bsrap_problem(). Returns the preferred
+    relay index of every subscriber (-1 for none), the bits y(j) served
+    to each and the beamset index each relay points (-1 for none).
+    """
+    subscribers = len(schedule.subscribers)
+    relays = len(schedule.relays)
+    if relays == 0:
+        return (numpy.full(subscribers, -1, dtype=numpy.intp), numpy.zeros(subscribers),
+                numpy.zeros(0, dtype=numpy.intp))
+    served = numpy.clip(numpy.asarray(x[:subscribers], dtype=float), 0.0, None)
+    assignment = numpy.asarray(x[subscribers:subscribers + relays * subscribers]).reshape(
+        relays, subscribers) > 0.5
+    preferred = numpy.where(assignment.any(axis=0), numpy.argmax(assignment, axis=0), -1)
+    chosen = numpy.full(relays, -1, dtype=numpy.intp)
+    offset = subscribers + relays * subscribers
+    for i, members in enumerate(schedule.members):
+        beams = numpy.asarray(x[offset:offset + len(members)])
+        if len(beams) > 0 and beams.max() > 0.5:
+            chosen[i] = int(numpy.argmax(beams))
+        offset += len(members)
+    return preferred, numpy.where(preferred >= 0, served, 0.0), chosen
+
+def optimal(network, backend=None, time_limit=None, mip_gap=None, filename=None,
+            schedule=None):
+    """
+    Solve BS-RAP exactly with a MILP backend ('highs' by default, or
+    'cplex'). The model is only written to disk when a filename is given.
+    Returns the objective value, or None when the solve fails.
+    """
+    if schedule is None:
+        schedule = BeamSchedule(network)
+    with profiling.span('optimal.build'):
+        problem = bsrap_problem(schedule, schedule.queue_lengths(network),
+                                names=filename is not None)
+    with profiling.span('optimal.solve', variables=len(problem.objective),
+                        constraints=problem.matrix.shape[0]):
+        solution = get_backend(backend).solve(problem, time_limit=time_limit,
+                                              mip_gap=mip_gap, filename=filename)
+    if solution is None:
+        return None
+    return solution.objective
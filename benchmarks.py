@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+#
+# Scaling Benchmarks
+#
+
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import platform
+import tracemalloc
+from collections import OrderedDict
+
+import numpy
+import networkx as nx
+
+import profiling
+from network import Network
+from simulation import Simulation
+from beam_scheduling import greedy1, greedy2, optimal
+from directional_antenna import KNN, MST
+from joint_routing_channel_selection import select_channels, select_channels_greedy, rcs_path
+
+# Largest number of nodes each phase is run at by default
+limits = OrderedDict([
+    ('network', 2000),
+    ('beamsets', 2000),
+    ('greedy1', 2000),
+    ('greedy2', 2000),
+    ('optimal', 300),
+    ('simulation', 2000),
+    ('mst', 1000),
+    ('knn', 2000),
+    ('initialize_edges', 2000),
+    ('select_channels', 2000),
+    ('select_channels_greedy', 2000),
+    ('rcs_path', 2000),
+])
+
+class PhaseTimeout(Exception):
+    pass
+
+def _alarm(signum, frame):
+    raise PhaseTimeout()
+
+def measure(name, function, memory=True, timeout=None):
+    """
+    Run function() as one benchmark phase. Returns (record, result) where
+    record holds the wall time, the peak traced memory and the outcome.
+    """
+    record = OrderedDict([('phase', name), ('seconds', None), ('peak_bytes', None),
+                          ('status', 'ok'), ('result', None)])
+    result = None
+    if memory:
+        tracemalloc.start()
+    if timeout and hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    try:
+        result = function()
+    except PhaseTimeout:
+        record['status'] = 'timeout'
+    except Exception as e:
+        record['status'] = "%s: %s" % (type(e).__name__, e)
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        if timeout and hasattr(signal, 'SIGALRM'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if memory:
+            record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    if isinstance(result, (int, float)):
+        record['result'] = result
+    return record, result
+
+def _walk(network, hops, rng):
+    "Edges of a random simple path with the given number of hops, if any."
+    nodes = sorted(network.nodes())
+    for attempt in range(100):
+        path = [rng.choice(nodes)]
+        while len(path) <= hops:
+            options = sorted(set(network.neighbors(path[-1])) - set(path))
+            if not options:
+                break
+            path.append(rng.choice(options))
+        if len(path) == hops + 1:
+            return list(zip(path[0:], path[1:]))
+    return None
+
+def benchmark(nodes, channels, hops, seed, phases, memory=True, timeout=None, slots=1000):
+    """
+    Yield one record per phase for a network of the given size. The
+    simulation phase runs slots slots of greedy1 scheduling.
+    """
+    def run(name, function, **extra):
+        record, result = measure(name, function, memory, timeout)
+        record.update(nodes=nodes, channels=channels, seed=seed, **extra)
+        records.append(record)
+        return result
+
+    if nodes > limits['network']:
+        return
+    random.seed(seed)
+    numpy.random.seed(seed)
+    relays = max(2, nodes // 40)
+    records = list()
+    network = run('network', lambda: Network(seed=seed, number_of_nodes=nodes,
+                                             relays=relays, channels=channels))
+    if network is None:
+        for record in records:
+            yield record
+        return
+
+    def wanted(name):
+        return name in phases and nodes <= limits[name]
+
+    if any(wanted(name) for name in ('beamsets', 'greedy1', 'greedy2', 'optimal', 'simulation')):
+        run('beamsets', network.beamsets)
+    if wanted('simulation'):
+        simulation = Simulation(network, 'greedy1', seed=seed)
+        run('simulation', lambda: float(simulation.run(slots)['backlog'][-1]), slots=slots)
+    for name, algorithm in (('greedy1', greedy1), ('greedy2', greedy2)):
+        if wanted(name):
+            run(name, lambda: algorithm(network))
+    if wanted('optimal'):
+        run('optimal', lambda: optimal(network, time_limit=timeout))
+    if wanted('mst'):
+        run('mst', lambda: MST(network))
+    if wanted('knn'):
+        copy = network.copy()
+        run('knn', lambda: KNN(copy))
+
+    routing = ('select_channels', 'select_channels_greedy', 'rcs_path')
+    if wanted('initialize_edges') or any(wanted(name) for name in routing):
+        run('initialize_edges', network.initialize_edges)
+        rng = random.Random(seed)
+        for length in hops:
+            path = _walk(network, length, rng)
+            if path is None:
+                continue
+            if wanted('select_channels'):
+                run('select_channels', lambda: select_channels(network, path), hops=length)
+            if wanted('select_channels_greedy'):
+                run('select_channels_greedy', lambda: select_channels_greedy(network, path),
+                    hops=length)
+        if wanted('rcs_path') and len(network) > 1:
+            src, dst = rng.sample(sorted(network.nodes()), 2)
+            if nx.has_path(network, src, dst):
+                run('rcs_path', lambda: rcs_path(network, src, dst))
+
+    for record in records:
+        yield record
+
+def compare(old, new):
+    "Print per-phase time and memory ratios between two result files."
+    def load(filename):
+        results = dict()
+        with open(filename) as f:
+            for line in f:
+                record = json.loads(line)
+                if 'phase' not in record or record['status'] != 'ok':
+                    continue
+                key = (record['phase'], record['nodes'], record['channels'],
+                       record.get('hops'), record['seed'])
+                results[key] = record
+        return results
+
+    before = load(old)
+    after = load(new)
+    print("%-24s %6s %4s %4s %12s %12s %8s %8s" % ("phase", "nodes", "ch", "hops",
+          "old (s)", "new (s)", "time", "memory"))
+    for key in sorted(set(before) & set(after), key=str):
+        a = before[key]
+        b = after[key]
+        time_ratio = b['seconds'] / a['seconds'] if a['seconds'] else float('nan')
+        memory_ratio = float('nan')
+        if a['peak_bytes'] and b['peak_bytes'] is not None:
+            memory_ratio = b['peak_bytes'] / float(a['peak_bytes'])
+        print("%-24s %6d %4d %4s %12.4f %12.4f %7.2fx %7.2fx" % (key[0], key[1], key[2],
+              key[3] if key[3] is not None else "-", a['seconds'], b['seconds'],
+              time_ratio, memory_ratio))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the toolkit's hot paths.")
+    parser.add_argument("--nodes", type=int, nargs="+",
+                        default=[10, 30, 100, 300, 1000, 3000, 10000])
+    parser.add_argument("--channels", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--hops", type=int, nargs="+", default=[2, 4, 6, 8])
+    parser.add_argument("--slots", type=int, default=1000,
+                        help="slots the simulation phase runs")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1])
+    parser.add_argument("--phases", nargs="+", default=list(limits), choices=list(limits))
+    parser.add_argument("--max-nodes", type=int, default=None,
+                        help="override the per-phase node limits")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds before a phase is abandoned")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip memory tracing, which slows the phases down")
+    parser.add_argument("--label", default="", help="version label stored in the header")
+    parser.add_argument("--output", default="-")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--trace", default=None,
+                        help="also record phase spans and write them as a Chrome trace")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.max_nodes is not None:
+        for name in limits:
+            limits[name] = args.max_nodes
+
+    if args.trace:
+        profiling.enable()
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    header = OrderedDict([('label', args.label), ('python', platform.python_version()),
+                          ('numpy', numpy.__version__), ('networkx', nx.__version__),
+                          ('memory', not args.no_memory), ('limits', limits)])
+    out.write(json.dumps(header) + "\n")
+    for nodes in args.nodes:
+        for channels in args.channels:
+            for seed in args.seeds:
+                for record in benchmark(nodes, channels, args.hops, seed, args.phases,
+                                        memory=not args.no_memory, timeout=args.timeout,
+                                        slots=args.slots):
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+    if out is not sys.stdout:
+        out.close()
+    if args.trace:
+        profiling.export_chrome_trace(args.trace)
+
+if __name__ == "__main__":
+    main()
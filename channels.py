@@ -0,0 +1,140 @@
+#
+# Compact Edge Channel Storage
+#
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy
+
+def edge_key(u, v):
+    "Canonical key of the undirected edge (u, v)."
+    if u <= v:
+        return (u, v)
+    return (v, u)
+
+class ChannelStore:
+    """
+    Channel capacities of every edge held in a single float32 tensor of
+    shape (edges, frequencies, channels), with a map from edge to row.
+    Edges read and write their capacities through a ChannelView, which
+    behaves like the nested e['channels'][freq][chan] dictionaries.
+    """
+
+    def __init__(self, frequencies, channels, capacity=1024):
+        self.frequencies = tuple(frequencies)
+        self.frequency_index = dict((f, i) for i, f in enumerate(self.frequencies))
+        self.channels = channels
+        self.capacities = numpy.zeros((capacity, len(self.frequencies), channels),
+                                      dtype=numpy.float32)
+        self.index = dict()
+        self.free = list()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, u, v):
+        "Allocate (or return the existing) row of edge (u, v)."
+        key = edge_key(u, v)
+        if key in self.index:
+            return self.index[key]
+        if self.free:
+            row = self.free.pop()
+        else:
+            self._reserve(self.size + 1)
+            row = self.size
+            self.size += 1
+        self.capacities[row] = 0.0
+        self.index[key] = row
+        return row
+
+    def _reserve(self, size):
+        "Grow the tensor, doubling, until it holds at least size rows."
+        if size > len(self.capacities):
+            grown = numpy.zeros((max(size, 2 * len(self.capacities)),) +
+                                self.capacities.shape[1:], dtype=numpy.float32)
+            grown[:self.size] = self.capacities[:self.size]
+            self.capacities = grown
+
+    def remove(self, u, v):
+        "Release the row of edge (u, v)."
+        row = self.index.pop(edge_key(u, v), None)
+        if row is not None:
+            self.free.append(row)
+
+    def fill(self, u, v, throughput):
+        """
+        Set the channels of edge (u, v) from a per-frequency throughput
+        sequence, or a (frequencies, channels) array, and return the
+        edge's view.
+        """
+        row = self.add(u, v)
+        throughput = numpy.asarray(throughput, dtype=numpy.float32)
+        if throughput.ndim == 1:
+            throughput = throughput[:, None]
+        self.capacities[row] = throughput
+        return ChannelView(self, row)
+
+    def total(self, row):
+        "Summed capacity of one row over all frequencies and channels."
+        return float(self.capacities[row].sum(dtype=numpy.float64))
+
+class ChannelView(Mapping):
+    "Per-edge view of a ChannelStore row, keyed by frequency."
+
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, freq):
+        return FrequencyView(self.store, self.row, self.store.frequency_index[freq])
+
+    def __setitem__(self, freq, channels):
+        view = self[freq]
+        for chan, throughput in channels.items():
+            view[chan] = throughput
+
+    def __iter__(self):
+        return iter(self.store.frequencies)
+
+    def __len__(self):
+        return len(self.store.frequencies)
+
+    def __repr__(self):
+        return repr(dict((freq, dict(self[freq])) for freq in self))
+
+class FrequencyView(Mapping):
+    "Channel capacities of one edge on one frequency, keyed by channel."
+
+    __slots__ = ('store', 'row', 'freq')
+
+    def __init__(self, store, row, freq):
+        self.store = store
+        self.row = row
+        self.freq = freq
+
+    def _check(self, chan):
+        if not 0 <= chan < self.store.channels:
+            raise KeyError(chan)
+
+    def __getitem__(self, chan):
+        self._check(chan)
+        return float(self.store.capacities[self.row, self.freq, chan])
+
+    def __setitem__(self, chan, throughput):
+        self._check(chan)
+        self.store.capacities[self.row, self.freq, chan] = throughput
+
+    def __iter__(self):
+        return iter(range(self.store.channels))
+
+    def __len__(self):
+        return self.store.channels
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -3,27 +3,59 @@
 #  (c) 2013 Ivan R. Judson / Montana State University
 #
 
+import math
+
+import numpy
 import networkx
 
 def KNN(network, K=3, beams=8):
-    """ Directional Antenna Algorithm """
-    # Neighbor dictionary for easy lookup later
-    neighbors = dict()
+    """
+    Directional Antenna Algorithm. Nodes are visited in order and each
+    one keeps the K nearest of the neighbours it still has: later nodes
+    it is joined to and earlier nodes that kept it. An edge survives when
+    both of its ends keep it, and every node points a beam at each
+    neighbour it keeps.
 
-    # Find nearest K_nearest_neighbors
-    for n in network.nodes():
-        node = network.node[n]
-        nlist = [(neighbor, network.distance(n, neighbor)) for neighbor in networkx.all_neighbors(network, n)]
-        neighbors[n] = [m[0] for m in sorted(nlist, key=lambda item: item[1])][0:K]
+    Candidates come from k-nearest queries on the KD-tree of node
+    positions, widened only for nodes whose nearest nodes are mostly
+    earlier ones, and the surviving edges replace the topology at once.
+    """
+    nodes = network.nodes()
+    if not nodes:
+        return network.update_node_throughput()
+    positions = network.geometry.positions
+    rank = dict((n, i) for i, n in enumerate(nodes))
+    tree = network.geometry.tree()
+    size = len(positions)
 
-        # Set active beams / edges
-        for neighbor in neighbors[n]:
-            node['active_beams'].add(network.beam_index(n, neighbor, beams))
+    # One bulk query covers most nodes; the rest widen their own query
+    k = min(2 * K + 1, size)
+    distances, candidates = tree.query(positions[nodes], k)
+    candidates = numpy.asarray(candidates).reshape(len(nodes), -1)
+
+    kept = dict()
+    for i, n in enumerate(nodes):
+        adjacent = network.adj[n]
+        row, width = candidates[i], k
+        while True:
+            choice = [m for m in row.tolist() if m != n and m < size and m in adjacent
+                      and (rank[m] > i or n in kept[m])][0:K]
+            if len(choice) == K or width >= size:
+                break
+            width = min(2 * width, size)
+            row = numpy.atleast_1d(tree.query(positions[n], width)[1])
+        kept[n] = set(choice)
+
+    # Set active beams
+    src = numpy.array([n for n in nodes for m in kept[n]], dtype=numpy.intp)
+    dst = numpy.array([m for n in nodes for m in kept[n]], dtype=numpy.intp)
+    bearings = numpy.asarray(network.geometry.bearing(src, dst), dtype=float)
+    indices = 1 + numpy.floor(numpy.radians(bearings) / ((2.0 * math.pi) / beams))
+    for n, beam in zip(src.tolist(), indices.astype(int).tolist()):
+        network.node[n]['active_beams'].add(beam)
 
-        # Remove unused edges
-        to_remove = set(networkx.all_neighbors(network, n)) - set(neighbors[n])
-        for m in to_remove:
-            network.remove_edge(n,m)
+    # Keep the edges both ends chose
+    network.retain_edges([(n, m) for n in nodes for m in kept[n] if n in kept[m]])
 
     # Get Total Weight and return it
     return network.update_node_throughput()
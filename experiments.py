@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#
+# Parallel Monte Carlo Experiment Runner
+#
+
+import csv
+import time
+import random
+import argparse
+import itertools
+import multiprocessing
+
+import numpy
+import networkx as nx
+
+from network import Network
+from metrics import MetricsSink
+from beam_scheduling import greedy1, greedy2, optimal
+from directional_antenna import KNN, MST
+from joint_routing_channel_selection import select_channels, select_channels_greedy, rcs_path
+
+# Network keyword arguments that can be swept
+PARAMETERS = ('number_of_nodes', 'relays', 'channels', 'theta', 'width', 'height', 'radial')
+
+def _route(network, seed):
+    "A reproducible (src, dst) pair of the network that is connected."
+    rng = random.Random(seed)
+    nodes = sorted(network.nodes())
+    for attempt in range(100):
+        src, dst = rng.sample(nodes, 2)
+        if nx.has_path(network, src, dst):
+            return src, dst
+    return None
+
+def _dijkstra(network, route):
+    path = nx.dijkstra_path(network, route[0], route[1], weight='distance')
+    return list(zip(path[0:], path[1:]))
+
+def _rcs(network, route):
+    pcs = rcs_path(network, route[0], route[1])
+    if pcs is None:
+        return 0.0
+    return select_channels(network, pcs.path)
+
+# Algorithm name -> (kind, function). Beam algorithms run after beamsets(),
+# routing algorithms after initialize_edges() on a routable (src, dst) pair.
+# Algorithms in on_copy prune the topology, so they run on a copy of the
+# network and their throughput is that of the copy.
+algorithms = {
+    'greedy1' : ('beam', greedy1),
+    'greedy2' : ('beam', greedy2),
+    'optimal' : ('beam', optimal),
+    'knn' : ('topology', KNN),
+    'mst' : ('topology', MST),
+    'dijkstra' : ('routing', lambda network, route: select_channels(network, _dijkstra(network, route))),
+    'dijkstra_greedy' : ('routing', lambda network, route: select_channels_greedy(network, _dijkstra(network, route))),
+    'rcs' : ('routing', _rcs),
+}
+on_copy = set(['knn'])
+
+def run_trial(job):
+    """
+    Build one network for a parameter set and seed and run every requested
+    algorithm on it. Returns one result row per algorithm.
+    """
+    parameters, seed, names = job
+    random.seed(seed)
+    numpy.random.seed(seed % (1 << 32))
+
+    start = time.time()
+    network = Network(seed=seed, **parameters)
+    network_time = time.time() - start
+
+    kinds = set(algorithms[name][0] for name in names)
+    setup_time = dict()
+    if 'beam' in kinds:
+        start = time.time()
+        network.beamsets()
+        setup_time['beam'] = time.time() - start
+
+    rows = list()
+    def run(name, *args):
+        kind, algorithm = algorithms[name]
+        row = dict(parameters, seed=seed, algorithm=name, objective=None,
+                   throughput=None, network_time=network_time,
+                   setup_time=setup_time.get(kind, 0.0), algorithm_time=None, error=None)
+        target = network.copy() if name in on_copy else network
+        start = time.time()
+        try:
+            row['objective'] = algorithm(target, *args)
+        except Exception as e:
+            row['error'] = "%s: %s" % (type(e).__name__, e)
+        row['algorithm_time'] = time.time() - start
+        row['throughput'] = target.update_node_throughput()
+        rows.append(row)
+
+    # Routing needs initialize_edges(), which prunes the topology, so it goes last
+    for name in names:
+        if algorithms[name][0] != 'routing':
+            run(name)
+    if 'routing' in kinds:
+        start = time.time()
+        network.initialize_edges()
+        setup_time['routing'] = time.time() - start
+        route = _route(network, seed)
+        for name in names:
+            if algorithms[name][0] == 'routing':
+                if route is None:
+                    rows.append(dict(parameters, seed=seed, algorithm=name,
+                                     network_time=network_time,
+                                     setup_time=setup_time['routing'],
+                                     error="no routable pair"))
+                else:
+                    run(name, route)
+    return rows
+
+def parameter_grid(grid):
+    "Every combination of a dict of parameter name -> list of values."
+    names = sorted(grid)
+    for values in itertools.product(*[grid[name] for name in names]):
+        yield dict(zip(names, values))
+
+def run_experiments(grid, seeds, names, filename="results.csv", processes=None,
+                    metrics=None, overwrite=False):
+    """
+    Run every algorithm in names on every parameter combination of grid
+    for each seed, fanning the trials out over a process pool. Rows are
+    streamed to a CSV file as trials finish and, when metrics names a
+    directory, to a MetricsSink there as well; overwrite lets it replace
+    the chunks of an earlier run. Returns the number of rows.
+    """
+    for name in names:
+        if name not in algorithms:
+            raise ValueError("unknown algorithm %s" % name)
+    for name in grid:
+        if name not in PARAMETERS:
+            raise ValueError("unknown network parameter %s" % name)
+    fields = sorted(grid) + ['seed', 'algorithm', 'objective', 'throughput',
+                             'network_time', 'setup_time', 'algorithm_time', 'error']
+    jobs = [(parameters, seed, list(names))
+            for parameters in parameter_grid(grid) for seed in seeds]
+
+    count = 0
+    sink = MetricsSink(metrics, overwrite=overwrite) if metrics is not None else None
+    with open(filename, "w", newline="") as out:
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        if processes == 1:
+            results = map(run_trial, jobs)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(run_trial, jobs)
+        try:
+            for rows in results:
+                writer.writerows(rows)
+                out.flush()
+                if sink is not None:
+                    sink.consume(rows)
+                count += len(rows)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if sink is not None:
+                sink.close()
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Monte Carlo experiments.")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[30])
+    parser.add_argument("--relays", type=int, nargs="+", default=[6])
+    parser.add_argument("--channels", type=int, nargs="+", default=[4])
+    parser.add_argument("--theta", type=float, nargs="+", default=[30.0])
+    parser.add_argument("--width", type=float, nargs="+", default=[20.0])
+    parser.add_argument("--height", type=float, nargs="+", default=[20.0])
+    parser.add_argument("--radial", action="store_true")
+    parser.add_argument("--algorithms", nargs="+", default=['greedy1', 'greedy2'],
+                        choices=sorted(algorithms))
+    parser.add_argument("--seeds", type=int, default=10, help="number of seeds")
+    parser.add_argument("--first-seed", type=int, default=1)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default="results.csv")
+    parser.add_argument("--metrics", default=None,
+                        help="directory to also stream result chunks into")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="replace the chunks of an earlier run in the metrics directory")
+    args = parser.parse_args(argv)
+
+    grid = {
+        'number_of_nodes' : args.nodes,
+        'relays' : args.relays,
+        'channels' : args.channels,
+        'theta' : args.theta,
+        'width' : args.width,
+        'height' : args.height,
+        'radial' : [args.radial]
+    }
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    count = run_experiments(grid, seeds, args.algorithms, args.output, args.processes,
+                            args.metrics, args.overwrite)
+    print("Wrote %d results to %s" % (count, args.output))
+
+if __name__ == "__main__":
+    main()
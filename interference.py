@@ -0,0 +1,174 @@
+#
+# Link Interference Graph
+#
+
+import numpy
+import scipy.sparse
+
+from channels import edge_key
+
+class InterferenceGraph:
+    """
+    Sparse link interference graph over the edges of a network.
+
+    Two edges interfere on (freq, chan) when both have capacity on it and
+    they either share a vertex or have endpoints closer than
+    signal_range[freq]. Candidate pairs only come from nodes that a
+    spatial range query puts within range of each other, so the work is
+    proportional to the number of interfering pairs rather than E^2. The
+    result is kept as one CSR adjacency per frequency plus an
+    (edges, frequencies, channels) availability mask.
+    """
+
+    def __init__(self, network, signal_range):
+        self.frequencies = tuple(network.FREQUENCIES)
+        self.frequency_index = dict((f, i) for i, f in enumerate(self.frequencies))
+        self.channels = network.channels
+        self.edges = [edge_key(u, v) for u, v in network.edges()]
+        self.index = dict((e, i) for i, e in enumerate(self.edges))
+        self.available = self._available(network)
+        self.neighbours = dict()
+        self._adjacency = dict()
+
+        geometry = network.geometry
+        nodes = len(geometry.positions)
+        edges = len(self.edges)
+        endpoints = numpy.array(self.edges, dtype=numpy.intp).reshape(edges, 2)
+        incidence = scipy.sparse.csr_matrix(
+            (numpy.ones(2 * edges), (endpoints.T.ravel(), numpy.tile(numpy.arange(edges), 2))),
+            shape=(nodes, edges))
+
+        for freq in self.frequencies:
+            if freq not in signal_range:
+                continue
+            near = geometry.pairs_within(signal_range[freq])
+            proximity = scipy.sparse.coo_matrix(
+                (numpy.ones(2 * len(near)), (near.T.ravel(), near[:, ::-1].T.ravel())),
+                shape=(nodes, nodes)).tocsr()
+            proximity = proximity + scipy.sparse.identity(nodes, format='csr')
+            adjacency = (incidence.T * (proximity * incidence)).tocsr()
+            adjacency.setdiag(0)
+            adjacency.eliminate_zeros()
+            adjacency.data[:] = 1
+            adjacency.sort_indices()
+            self.neighbours[freq] = adjacency.astype(bool)
+
+    @classmethod
+    def from_arrays(cls, frequencies, channels, edges, available, neighbours):
+        """
+        Rebuild a graph from its edges, availability mask and per-frequency
+        CSR adjacency, e.g. as saved in a snapshot.
+        """
+        graph = cls.__new__(cls)
+        graph.frequencies = tuple(frequencies)
+        graph.frequency_index = dict((f, i) for i, f in enumerate(graph.frequencies))
+        graph.channels = channels
+        graph.edges = [tuple(edge) for edge in edges]
+        graph.index = dict((e, i) for i, e in enumerate(graph.edges))
+        graph.available = available
+        graph.neighbours = dict(neighbours)
+        graph._adjacency = dict()
+        return graph
+
+    def _available(self, network):
+        return network.channel_capacities(self.edges) > 0.0
+
+    def edge_index(self, link):
+        """
+        Index of an edge, given as an (u, v) tuple or anything with an
+        edge attribute; None when it is not part of the graph.
+        """
+        edge = getattr(link, 'edge', link)
+        if not isinstance(edge, tuple) or len(edge) != 2:
+            return None
+        return self.index.get(edge_key(*edge))
+
+    def adjacency(self, freq, chan):
+        "CSR adjacency of the edges interfering on (freq, chan)."
+        key = (freq, chan)
+        if key not in self._adjacency:
+            if freq not in self.neighbours:
+                self._adjacency[key] = scipy.sparse.csr_matrix((len(self.edges),) * 2, dtype=bool)
+            else:
+                mask = self.available[:, self.frequency_index[freq], chan]
+                adjacency = self.neighbours[freq].multiply(mask[:, None])
+                adjacency = adjacency.multiply(mask[None, :]).tocsr()
+                adjacency.eliminate_zeros()
+                adjacency.sort_indices()
+                self._adjacency[key] = adjacency.astype(bool)
+        return self._adjacency[key]
+
+    def interferes(self, a, b, freq, chan):
+        "True when edges (or links) a and b interfere on (freq, chan)."
+        i = self.edge_index(a)
+        j = self.edge_index(b)
+        if i is None or j is None or i == j or freq not in self.neighbours:
+            return False
+        f = self.frequency_index[freq]
+        if not (self.available[i, f, chan] and self.available[j, f, chan]):
+            return False
+        neighbours = self.neighbours[freq]
+        row = neighbours.indices[neighbours.indptr[i]:neighbours.indptr[i + 1]]
+        k = numpy.searchsorted(row, j)
+        return bool(k < len(row) and row[k] == j)
+
+class InterferenceOracle:
+    """
+    Interference between the hops of one path as integer bitsets.
+    conflicts[bit][i] has bit j set when hops i and j interfere on the
+    (freq, channel) pair with mask bit FREQUENCIES.index(freq) * channels
+    + channel. Clique sizes are cached, since the same queries repeat for
+    every link of a channel selection run.
+    """
+
+    def __init__(self, network, path):
+        self.path = list(path)
+        self.channels = network.channels
+        self.frequency_index = dict((f, i) for i, f in enumerate(network.FREQUENCIES))
+        pairs = len(network.FREQUENCIES) * network.channels
+        hops = len(self.path)
+        self.conflicts = [[0] * hops for bit in range(pairs)]
+        self._cliques = dict()
+
+        graph = network.interference
+        if graph is None or hops == 0:
+            return
+        indices = [graph.edge_index(edge) for edge in self.path]
+        known = numpy.array([i is not None for i in indices])
+        rows = numpy.array([i if i is not None else 0 for i in indices], dtype=numpy.intp)
+        for freq, neighbours in graph.neighbours.items():
+            f = graph.frequency_index[freq]
+            adjacent = neighbours[rows][:, rows].toarray() & known[:, None] & known[None, :]
+            for channel in range(min(self.channels, graph.channels)):
+                available = graph.available[rows, f, channel] & known
+                interfering = adjacent & available[:, None] & available[None, :]
+                bitsets = self.conflicts[self.frequency_index[freq] * self.channels + channel]
+                for i, j in zip(*numpy.nonzero(interfering)):
+                    bitsets[i] |= 1 << int(j)
+
+    def bit(self, freq, channel):
+        return self.frequency_index[freq] * self.channels + channel
+
+    def interferes(self, i, j, freq, channel):
+        "True when hops i and j of the path interfere on (freq, channel)."
+        return bool(self.conflicts[self.bit(freq, channel)][i] >> j & 1)
+
+    def clique(self, bit, loc, members):
+        """
+        Size of the largest set of mutually interfering hops on pair bit
+        that contains hop loc and is drawn from the members bitset.
+        """
+        key = (bit, loc, members)
+        if key not in self._cliques:
+            candidates = members & self.conflicts[bit][loc] & ~(1 << loc)
+            self._cliques[key] = 1 + self._largest(self.conflicts[bit], candidates)
+        return self._cliques[key]
+
+    def _largest(self, conflicts, candidates):
+        best = 0
+        while candidates and bin(candidates).count("1") > best:
+            low = candidates & -candidates
+            candidates ^= low
+            hop = low.bit_length() - 1
+            best = max(best, 1 + self._largest(conflicts, candidates & conflicts[hop]))
+        return best
@@ -4,7 +4,18 @@
 #
 
 import sys
+import math
+import heapq
 import pprint
+import weakref
+import functools
+import itertools
+import multiprocessing
+
+import numpy
+
+import profiling
+from interference import InterferenceOracle
 
 class PCS:
     def __init__(self, other=None):
@@ -34,21 +45,57 @@ class Path:
         return "/ %e / [ %s ]" % (self.throughput, self.selected)
 
 class Link:
-    def __init__(self, edge=None, freq=-1.0, channel=-1):
-        self.edge = edge
-        self.freq = freq
-        self.channel = channel
+    """
+    A (freq, channel) pair on an edge. Links are interned: equal
+    arguments give back the same object, so links compare and hash by
+    identity and repeated lookups allocate nothing.
+    """
+
+    __slots__ = ('edge', 'freq', 'channel', '__weakref__')
+
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, edge=None, freq=-1.0, channel=-1):
+        key = (edge, freq, channel)
+        link = cls._interned.get(key)
+        if link is None:
+            link = object.__new__(cls)
+            link.edge = edge
+            link.freq = freq
+            link.channel = channel
+            cls._interned[key] = link
+        return link
+
+    def __reduce__(self):
+        return (Link, (self.edge, self.freq, self.channel))
 
     def __repr__(self):
         return "/ (%d, %d), %f, %d /" % (self.edge[0], self.edge[1], self.freq, self.channel)
 
-    def __eq__(self, other):
-        if self.edge == other.edge and self.freq == other.freq and self.channel == other.channel:
-            return True
-        return False
-
-    def __hash__(self):
-        return hash((self.edge, self.freq, self.channel))
+# Channel masks. A (freq, channel) pair is bit
+# FREQUENCIES.index(freq) * channels + channel of a channel mask.
+
+def mask_bits(mask):
+    "Generate the set bits of a mask, lowest first."
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def mask_to_links(network, edge, mask):
+    "Set of the Links of an edge on the pairs of a channel mask."
+    links = set()
+    for bit in mask_bits(mask):
+        f, channel = divmod(bit, network.channels)
+        links.add(Link(edge, network.FREQUENCIES[f], channel))
+    return links
+
+def capacity_mask(capacities):
+    "Channel mask of the pairs with capacity in an edge_capacities() vector."
+    mask = 0
+    for bit in numpy.flatnonzero(capacities > 0.0).tolist():
+        mask |= 1 << bit
+    return mask
 
 # Joint Routing and Channel Selection
 def rcs_add_edge_weights(network, src, dst):
@@ -69,279 +116,236 @@ def rcs_add_edge_weights(network, src, dst):
 
 def find_available_links(network, path):
     available_links = dict()
-    for i in range(len(path)):
-        available_links[i] = set()
-        edge = path[i]
-        for freq in network.FREQUENCIES:
-            for c in range(network.channels):
-                if network[edge[0]][edge[1]]['channels'][freq][c] > 0.0:
-                    available_links[i].add(Link(edge, freq, c))
+    for i, edge in enumerate(path):
+        mask = capacity_mask(edge_capacities(network, edge[0], edge[1]))
+        available_links[i] = mask_to_links(network, edge, mask)
     return available_links
 
-def check_interference(network, i, j, f, c):
-    if f in network.interference[i][j]:
-        if c in network.interference[i][j][f]:
-            return network.interference[i][j][f][c]
-
-    return False
-
-def compute_bridging_set(network, available_links, idx):
-    bridging_set = set()
-    bridging_set.update(available_links[idx])
-    left = set()
-    right = set()
-    for i in available_links.keys():
-        if i <= idx:
-            left.update(available_links[i])
-        else:
-            right.update(available_links[i])
-
-    for l in left:
-        for r in right:
-            if l == r and check_interference(network, l, r, l.freq, l.channel):
-                bridging_set.update([l, r])
-
-    return bridging_set
-
-def encode_set(network, set_in, subset):
-    idx = 0
-    k = 0
-    for el in set_in:
-        if el in subset:
-            idx += (1 << k)
-        k += 1
-    return idx
-
-def decode_set(network, set_in, idx):
-    subset = set()
-    k = 0
-    for el in set_in:
-        value = idx >> k
-        if (idx >> k ) % 2 == 1:
-            subset.add(el)
-        k += 1
-    return subset
-
-def max_clique(network, links, loc, freq, channel):
-    max_size = 0
-    i = 0
-    while i < len(links):
-        j = i + 1
-        while j < len(links) and check_interference(network, links[i], links[j], freq, channel):
-            j += 1
-        size = j - i + 1
-        if i <= loc and j <= loc and size > max_size:
-            max_size = size
-        i += 1
-    return max_size
-
-def throughput_for_test_path(network, old_path, test_path_channel_set):
-    path_len = len(old_path)
-    path = old_path[:]
-
-    if test_path_channel_set is None:
+def max_clique(oracle, links, loc, freq, channel):
+    """
+    Size of the largest set of mutually interfering hops on (freq,
+    channel) that contains hop loc and is drawn from the hop positions in
+    links, taken from an InterferenceOracle for the path.
+    """
+    members = 1 << loc
+    for position in links:
+        members |= 1 << position
+    return oracle.clique(oracle.bit(freq, channel), loc, members)
+
+def edge_capacities(network, u, v):
+    """
+    Capacity of every (freq, channel) pair of an edge. Pair (freq, c) is
+    entry FREQUENCIES.index(freq) * channels + c, which is also its bit in
+    channel masks.
+    """
+    store = network.channel_store
+    if store is not None:
+        return store.capacities[network[u][v]['channels'].row].ravel().astype(float)
+    capacities = numpy.zeros(len(network.FREQUENCIES) * network.channels)
+    channels = network[u][v]['channels']
+    for f, freq in enumerate(network.FREQUENCIES):
+        for c in range(network.channels):
+            capacities[f * network.channels + c] = channels[freq][c]
+    return capacities
+
+def path_capacities(network, path):
+    "(hops, frequencies * channels) array of edge_capacities() along a path."
+    capacities = numpy.zeros((len(path), len(network.FREQUENCIES) * network.channels))
+    for i, (u, v) in enumerate(path):
+        capacities[i] = edge_capacities(network, u, v)
+    return capacities
+
+def subset_totals(capacities):
+    "Total capacity of every bitmask over the pairs of a capacity vector."
+    totals = numpy.zeros(1)
+    for capacity in capacities:
+        totals = numpy.concatenate((totals, totals + capacity))
+    return totals
+
+def submask_max(values):
+    "For every bitmask, the largest value over all of its submasks."
+    best = values.copy()
+    for bit in range(len(values).bit_length() - 1):
+        view = best.reshape(-1, 2, 1 << bit)
+        numpy.maximum(view[:, 1, :], view[:, 0, :], out=view[:, 1, :])
+    return best
+
+# Widest channel mask select_channels() tabulates. Every hop's table has
+# 2 ** pairs float entries, 8 MB per hop at this width.
+MAX_SELECT_PAIRS = 20
+
+def select_channels(network, path, max_pairs=MAX_SELECT_PAIRS):
+    """
+    Best throughput of a path over every choice of (freq, channel) subset
+    on each hop. A hop's throughput is the capacity of its subset divided
+    by its clique size: 1 for a single hop, otherwise 2, or 3 for an inner
+    hop whose neighbours on both sides share a pair. The sizes are
+    positional; the network's interference graph does not enter them.
+
+    Subsets are bitmasks over the pairs available somewhere on the path,
+    so every table below has one entry per mask. The neighbours of a hop
+    are both on the other side of the even/odd split, so once each inner
+    hop is assigned a clique of 2 (its neighbours must be disjoint) or 3
+    the even and odd hops form two independent chains. Each chain is a
+    dynamic program over the subset of its last hop; a disjoint step
+    takes the best predecessor over the submasks of the complement. The
+    clique choices are searched depth first and a branch is cut once its
+    chains cannot beat the best path found so far.
+
+    The tables grow as 2 ** (pairs available on the path). Beyond
+    max_pairs pairs the greedy selection is returned instead; it uses the
+    same clique sizes, so it is a lower bound on the optimum.
+    """
+    if path is None or len(path) == 0:
         return 0.0
 
-    for i in range(0, path_len):
-        max_clique_size = 1
-        if path_len > 1:
-            max_clique_size = 2
-        if i > 1 and i < path_len:
-            left = set()
-            right = set()
-            for j in range(0, len(test_path_channel_set.selected)):
-                if j <= i:
-                    left.update(test_path_channel_set.selected[j])
-                else:
-                    right.update(test_path_channel_set.selected[j])                    
-
-            if len(left & right) > 0:
-                max_clique_size = 3
-
-        link_throughput = 0.0
-
-        for link in test_path_channel_set.selected[i]:
-            links = list()
-            for j in range(0, path_len):
-                test_link = Link(path[j], link.freq, link.channel)
-                if test_link in test_path_channel_set.selected[j]:
-                    links.append(j)
-
-            max_channel_clique_size = max(max_clique_size, max_clique(network, links, i, link.freq, link.channel))
-            link_throughput += (network[link.edge[0]][link.edge[1]]['channels'][link.freq][link.channel] / max_channel_clique_size)
-    
-        test_path_channel_set.throughput = min(test_path_channel_set.throughput, link_throughput)
-
-    return test_path_channel_set.throughput
-
-def throughput_for_path(network, path, bridging_set, path_len, available_links):
-    i = len(path.selected)-1
-    max_clique_size = 1
-    if path_len > 1: 
-        max_clique_size = 2
-
-    if i > 1 and i < path_len - 1:
-        left = set()
-        for link in path.selected[i-1]:
-            left.add((link.freq, link.channel))
-        right = set()
-        for link in available_links[i+1] & bridging_set:
-            right.add((link.freq, link.channel))
-        if len(left & right) > 0:
-            max_clique_size = 3
-
-    link_throughput = 0.0
-
-    for link in path.selected[i]:
-        links = list()
-        for j in range(0, i):
-            edge = network.edges()[j]
-            test_link = Link(edge, link.freq, link.channel)
-            if test_link in path.selected[j]:
-                links.append(j)
-
-        links.append(i)
-
-        for link2 in bridging_set:
-            if link.channel == link2.channel and link.freq == link2.freq \
-                    and link2.edge[0] > i:
-                links.append(link.edge)
-
-        max_channel_clique_size = max(max_clique_size, max_clique(network, links, i, link.freq, link.channel))
-        link_throughput += (network[link.edge[0]][link.edge[1]]['channels'][link.freq][link.channel] / max_channel_clique_size)
-    
-    path.throughput = min(path.throughput, link_throughput)
-
-def select_channels(network, path):
+    hops = len(path)
+    capacities = path_capacities(network, path)
+    capacities = capacities[:, (capacities > 0.0).any(axis=0)]
+    if capacities.shape[1] > max_pairs:
+        if profiling.enabled:
+            profiling.count('select_channels.fallback')
+        return select_channels_greedy(network, path)
+    totals = [subset_totals(row) for row in capacities]
+    masks = numpy.arange(len(totals[0]), dtype=numpy.int64)
+    complement = masks[::-1]
+
+    base = 1.0 if hops == 1 else 2.0
+    def inner(i):
+        return 1 < i < hops - 1
+
+    # Upper bound of hops i.. using every pair they have
+    remaining = numpy.minimum.accumulate(
+        numpy.array([total[-1] for total in totals])[::-1] / base)[::-1]
+    best = [0.0]
+
+    def search(i, chains, disjoint):
+        # chains[p] maps the subset of the last hop of parity p to the best
+        # bottleneck of the parity p hops so far; disjoint says whether
+        # hop i-1 needs hops i-2 and i to share nothing
+        if i == hops:
+            best[0] = max(best[0], min(chain.max() for chain in chains if chain is not None))
+            return
+        bound = min([remaining[i]] + [chain.max() for chain in chains if chain is not None])
+        if bound <= best[0]:
+            return
+
+        with profiling.span('select_channels.stage', stage=i):
+            previous = chains[i % 2]
+            if previous is None:
+                reach = numpy.inf
+            elif disjoint:
+                reach = submask_max(previous)[complement]
+            else:
+                reach = previous.max()
+            if profiling.enabled:
+                profiling.count('select_channels.states', len(masks))
+
+        for clique in ((2.0, 3.0) if inner(i) else (base,)):
+            chain = numpy.minimum(totals[i] / clique, reach)
+            following = list(chains)
+            following[i % 2] = chain
+            search(i + 1, following, inner(i) and clique == 2.0)
+
+    search(0, [None, None], False)
+    return float(best[0])
+
+def select_channels_greedy(network, path, interference=False):
+    """
+    Greedy channel selection: the first hop takes every available pair
+    and each following hop the available pairs its predecessor did not
+    take, or all of them when that leaves none. Returns the throughput of
+    the selection with the clique sizes of select_channels(), so the two
+    are comparable. Those clique sizes are positional: they only depend
+    on how many hops the path has and on which neighbouring hops share a
+    pair, never on the network's interference graph. With
+    interference=True a hop's clique on each pair is also grown from the
+    link interference graph through an InterferenceOracle, a harsher
+    model than the one select_channels() and rcs_path() use.
+    """
     if path is None or len(path) == 0:
         return 0.0
 
     path_len = len(path)
-    bridging_set = dict()
-    bridging_set_count = dict()
-
-    # Find all available freq/channels for each edge along the path
-    available_links = find_available_links(network, path)
-
-    # Compute bridging sets for each edge on the path
-    for i in range(0, len(path)):
-        bridging_set[i] = compute_bridging_set(network, available_links, i)
-        bridging_set_count[i] = pow(2, len(bridging_set[i]))
-
-    # Initialize Dynamic programming
-    best_path_channel_set = dict()
-    for i in range(0, len(path)):
-        best_path_channel_set[i] = dict()
-    for k in range(bridging_set_count[0]):
-        best_path_channel_set[0][k] = Path()
-
-    for i in range(1, len(path)):
-        new_part = bridging_set[i].copy() - bridging_set[i-1]
-        old_part = bridging_set[i].copy() & bridging_set[i-1]
-
-        for k in range(bridging_set_count[i-1]):
-            previous_best = best_path_channel_set[i-1][k]
-            previous_bridging_set = decode_set(network, bridging_set[i-1], k)
-            copy_of_old_part = old_part.copy() & previous_bridging_set
-            if len(new_part) == 0:
-                next_bridging_set_idx = encode_set(network, bridging_set[i], copy_of_old_part)
-                test_path = Path(selected=previous_best.selected[:])
-                test_path.selected.append(previous_bridging_set.selected.copy() & available_links[i-1])
-                throughput_for_path(network, test_path, previous_bridging_set, path_len, available_links)
-                if next_bridging_set_idx not in best_path_channel_set[i] or \
-                   test_path.throughput > best_path_channel_set[i][next_bridging_set_idx].throughput:
-                    best_path_channel_set[i][next_bridging_set_idx] = test_path
-            else:
-                for l in range(1 << len(new_part)):
-                    next_bridging_subset = decode_set(network, new_part, l) 
-                    next_bridging_subset.update(old_part.copy())
-                    next_bridging_set_idx = encode_set(network, bridging_set[i], next_bridging_subset)
-                    test_path = Path(selected=previous_best.selected[:])
-                    test_path.selected.append(previous_bridging_set.copy() & available_links[i-1])
-                    throughput_for_path(network, test_path, next_bridging_subset, path_len, available_links)
-                    if next_bridging_set_idx not in best_path_channel_set[i] or \
-                       test_path.throughput > best_path_channel_set[i][next_bridging_set_idx].throughput:
-                        best_path_channel_set[i][next_bridging_set_idx] = test_path
-
-
-    optimal_path = None
-    empty = set()
-    for k in range(bridging_set_count[path_len - 1]):
-        next_bridging_subset = decode_set(network, bridging_set[path_len - 1], k)
-        previous_best = best_path_channel_set[path_len - 1][k]
-        test_path = Path(selected=previous_best.selected[:], 
-                         throughput=previous_best.throughput)
-        test_path.selected.append(next_bridging_subset.copy() & available_links[path_len - 1])
-        throughput_for_path(network, test_path, empty, path_len, available_links)
-        if optimal_path is None or test_path.throughput > optimal_path.throughput:
-            optimal_path = test_path
-
-    if optimal_path:
-        return optimal_path.throughput
-
-    return 0.0
-
-def select_channels_greedy(network, path):
-    path_len = len(path)
-
-    available_links = find_available_links(network, path)
-    greedy_path = Path(selected=[available_links[0]])
-
+    capacities = path_capacities(network, path)
+    available = [capacity_mask(row) for row in capacities]
+    selected = [available[0]]
     for i in range(1, path_len):
-        remove_set = set()
-        for link in greedy_path.selected[i-1]:
-            new_link = Link(i, link.freq, link.channel)
-            remove_set.add(new_link)
-        next_set = available_links[i] - remove_set
-        if len(next_set) > 0:
-            greedy_path.selected.append(next_set)
-        else:
-            print(type(available_links[i]))
-            greedy_path.selected.append(available_links[i])
+        next_set = available[i] & ~selected[i-1]
+        selected.append(next_set if next_set else available[i])
 
+    oracle = InterferenceOracle(network, path) if interference else None
+    throughput = sys.float_info.max
     for i in range(0, path_len):
         max_clique_size = 1
         if path_len > 1:
             max_clique_size = 2
-
-        if i > 1 and i < path_len - 1:
-            left = set()
-            for link in greedy_path.selected[i-1]:
-                left.add((link.freq, link.channel))
-            right = set()
-            for link in greedy_path.selected[i+1]:
-                right.add((link.freq, link.channel))
-            left &= right
-            if len(left) > 0:
-                max_clique_size = 3
+        if i > 1 and i < path_len - 1 and selected[i-1] & selected[i+1]:
+            max_clique_size = 3
 
         link_throughput = 0.0
-        link_nums = list()
-        for link in greedy_path.selected[i]:
-            link_nums = list()
-            link_nums.append(i)
-
-            for j in range(0, i):
-                test_link = Link(j, link.freq, link.channel)
-                if test_link in greedy_path.selected[j]:
-                    link_nums.append(j)
-            for j in range(i+1,path_len):
-                test_link = Link(j, link.freq, link.channel)
-                if test_link in greedy_path.selected[j]:
-                    link_nums.append(j)
-            max_clique_size = max(max_clique_size, 
-                                  max_clique(network, link_nums, i, link.freq, link.channel))
-            link_throughput += network[link.edge[0]][link.edge[1]]['channels'][link.freq][link.channel]
-        greedy_path.throughput = min(greedy_path.throughput, link_throughput)
-    return greedy_path.throughput
-
-def combinations(current, combos):
-    combos.update(current)
-    for o in current:
-        next = current[:]
-        next.remove(o)
-        if len(next) > 0:
-            combinations(next[:], combos)
+        for bit in mask_bits(selected[i]):
+            clique = max_clique_size
+            if oracle is not None:
+                f, channel = divmod(bit, network.channels)
+                link_nums = [j for j in range(path_len) if selected[j] >> bit & 1]
+                clique = max(clique, max_clique(oracle, link_nums, i,
+                                                network.FREQUENCIES[f], channel))
+            link_throughput += capacities[i, bit] / clique
+        throughput = min(throughput, link_throughput)
+    return throughput
+
+def channel_subsets(mask, max_size=None):
+    """
+    Generate every non-empty subset of a channel mask exactly once,
+    smallest first, up to subsets of max_size pairs.
+    """
+    bits = [1 << p for p in range(mask.bit_length()) if mask >> p & 1]
+    if max_size is None or max_size > len(bits):
+        max_size = len(bits)
+    for size in range(1, max_size + 1):
+        for combination in itertools.combinations(bits, size):
+            yield sum(combination)
+
+# Most subsets channel_options() enumerates for one edge: every subset of
+# 12 pairs when the size is not bounded. The cache below keeps at most
+# 512 such arrays, 16 MB.
+MAX_CHANNEL_OPTIONS = 1 << 12
+
+def subset_count(pairs, max_size=None):
+    "Number of non-empty subsets of up to max_size of pairs items."
+    if max_size is None or max_size > pairs:
+        max_size = pairs
+    return sum(math.comb(pairs, size) for size in range(1, max_size + 1))
+
+@functools.lru_cache(maxsize=512)
+def _subset_array(mask, max_size):
+    "channel_subsets() of a mask as an array, shared by every edge with that mask."
+    return numpy.fromiter(channel_subsets(mask, max_size), dtype=numpy.int64)
+
+def channel_options(capacities, max_size=None):
+    """
+    (total capacity, mask) of the full set of available pairs of an edge
+    and of its subsets of up to max_size pairs (none when max_size is 0),
+    largest total first. Raises ValueError when that is more than
+    MAX_CHANNEL_OPTIONS subsets, which an unbounded max_size reaches at
+    13 available pairs.
+    """
+    mask = capacity_mask(capacities)
+    if mask == 0:
+        return []
+    options = [(float(capacities.sum()), mask)]
+    if max_size != 0:
+        count = subset_count(bin(mask).count("1"), max_size)
+        if count > MAX_CHANNEL_OPTIONS:
+            raise ValueError("%d channel subsets on one edge, more than %d; "
+                             "bound the subset size" % (count, MAX_CHANNEL_OPTIONS))
+        subsets = _subset_array(mask, max_size)
+        subsets = subsets[subsets != mask]
+        bits = (subsets[:, None] >> numpy.arange(len(capacities))) & 1
+        options.extend(zip(bits.dot(capacities).tolist(), subsets.tolist()))
+    options.sort(key=lambda option: -option[0])
+    return options
 
 def vertices_for_path(path):
     "path is a list of tuples of edges"
@@ -349,61 +353,235 @@ def vertices_for_path(path):
     [vertices.update(list(edge)) for edge in path]
     return vertices
 
-def rcs_path(network, src, dst, consider=10):
-    # Initialize
-    for node in network.nodes():
-        network.node[node]['rcs_paths'] = dict()
-        if node == src:
-            network.node[node]['rcs_paths'][0.0] = PCS()
-
-    for i in range(len(network.nodes())):
-        for e in network.edges():
-            u = e[0]
-            v = e[1]
-            chset = set()
-            cset = list()
-
-            for freq in network.FREQUENCIES:
-                for channel in range(network.channels):
-                    if network[u][v]['channels'][freq][channel] > 0.0:
-                        cset.append((freq, channel))
-
-            combinations(cset, chset)
-
-            for thpt, opcs in network.node[u]['rcs_paths'].items():
-                new_path = opcs.path[:]
-                if len(opcs.path) == i and v not in vertices_for_path(opcs.path):
-                    for chs in chset:
-                        npcs = PCS(other=opcs)
-                        npcs.path.append(e)
-                        nls = set()
-                        for freq in network.FREQUENCIES:
-                            for channel in range(0, network.channels):
-                                nls.add(Link(e, freq, channel))
-                        npcs.path_channel_set.selected.append(nls)
-                        thpt = throughput_for_test_path(network, npcs.path, npcs.path_channel_set)
-                        network.node[v]['rcs_paths'][thpt] = npcs
-                        if len(network.node[v]['rcs_paths'].keys()) > consider:
-                            del network.node[v]['rcs_paths'][min(network.node[v]['rcs_paths'].keys())]
-
-            for thpt, opcs in list(network.node[v]['rcs_paths'].items()):
-                new_path = opcs.path[:]
-                if len(opcs.path) == i and u not in vertices_for_path(opcs.path):
-                    for chs in chset:
-                        npcs = PCS(other=opcs)
-                        npcs.path.append(e)
-                        nls = set()
-                        for freq in network.FREQUENCIES:
-                            for channel in range(0, network.channels):
-                                nls.add(Link(e, freq, channel))
-                        npcs.path_channel_set.selected.append(nls)
-                        thpt = throughput_for_test_path(network, npcs.path, npcs.path_channel_set)
-                        network.node[v]['rcs_paths'][thpt] = npcs
-                        if len(network.node[u]['rcs_paths'].keys()) > consider:
-                            del network.node[u]['rcs_paths'][min(network.node[u]['rcs_paths'].keys())]
-
-
-    if len(network.node[dst]['rcs_paths']) == 0:
+class Label:
+    """
+    A partial path in rcs_path(): the last hop, its channel mask and the
+    total capacity of that mask, the bottleneck of the hops before it
+    (whose clique size can no longer change) and the bottleneck of the
+    whole path if it ended here.
+    """
+
+    __slots__ = ('node', 'parent', 'edge', 'hops', 'mask', 'total', 'settled',
+                 'throughput', 'visited', 'alive')
+
+    def __init__(self, node, parent=None, edge=None, mask=0, total=0.0,
+                 settled=float('inf'), throughput=float('inf')):
+        self.node = node
+        self.parent = parent
+        self.edge = edge
+        self.hops = 0 if parent is None else parent.hops + 1
+        self.mask = mask
+        self.total = total
+        self.settled = settled
+        self.throughput = throughput
+        self.visited = 1 << node if parent is None else parent.visited | 1 << node
+        self.alive = True
+
+    def extend(self, node, edge, mask, total):
+        """
+        Label for this path plus one hop. Only the previous last hop's
+        clique changes: it becomes 2, or 3 once it is an inner hop whose
+        neighbours share a pair, so throughput is updated in O(1).
+        """
+        if self.hops == 0:
+            return Label(node, self, edge, mask, total, throughput=total)
+        clique = 2.0
+        if self.hops > 2 and self.parent.mask & mask:
+            clique = 3.0
+        settled = min(self.settled, self.total / clique)
+        return Label(node, self, edge, mask, total, settled, min(settled, total / 2.0))
+
+    def dominates(self, other):
+        """
+        True when no extension of other can beat the same extension of
+        self. Self must not have visited a node other has not, or a
+        continuation open to other could be closed to self.
+        """
+        phase = min(self.hops, 3)
+        return (phase == min(other.hops, 3) and self.settled >= other.settled
+                and self.total >= other.total and self.mask & ~other.mask == 0
+                and self.visited & ~other.visited == 0
+                and (self.hops < 3 or self.parent.mask & ~other.parent.mask == 0))
+
+    def hops_and_masks(self):
+        "The (edge, mask) of every hop of this label's path, in order."
+        hops = list()
+        label = self
+        while label.parent is not None:
+            hops.append((label.edge, label.mask))
+            label = label.parent
+        hops.reverse()
+        return hops
+
+    def pcs(self, network):
+        "The path of this label as a PCS."
+        return _make_pcs(network, self.hops_and_masks(), self.throughput)
+
+def _make_pcs(network, hops, throughput):
+    "PCS of a path given as (edge, channel mask) hops."
+    pcs = PCS()
+    pcs.path = [edge for edge, mask in hops]
+    pcs.throughput = throughput
+    pcs.path_channel_set = Path(selected=[mask_to_links(network, edge, mask)
+                                          for edge, mask in hops],
+                                throughput=throughput)
+    return pcs
+
+def _add_label(store, candidate, consider):
+    """
+    Add a label to a node's store unless a stored label dominates it.
+    Labels it dominates are retired and when the store grows beyond
+    consider labels the lowest throughput one is dropped. Returns whether
+    the candidate was kept.
+    """
+    if any(other.dominates(candidate) for other in store):
+        return False
+    for other in store:
+        if candidate.dominates(other):
+            other.alive = False
+    store[:] = [other for other in store if other.alive]
+    store.append(candidate)
+    if len(store) > consider:
+        worst = min(store, key=lambda other: other.throughput)
+        worst.alive = False
+        store.remove(worst)
+        return worst is not candidate
+    return True
+
+def rcs_path(network, src, dst, consider=10, max_subset_size=0):
+    """
+    Highest throughput path from src to dst as a PCS (None when dst
+    cannot be reached). Every hop uses either all of its available
+    channels or, when max_subset_size is not 0, a subset of at most that
+    many (freq, channel) pairs; None allows every subset. An edge with
+    more than MAX_CHANNEL_OPTIONS subsets to try raises ValueError.
+
+    Label-setting search: partial paths are expanded in order of their
+    throughput, which can only drop as hops are added, so the first label
+    to reach dst is the best one. Every node keeps at most consider
+    labels, none dominated by another; the result is exact as long as no
+    store has to drop a label for being over consider, and otherwise the
+    best path among the labels kept.
+    """
+    if src == dst:
+        return PCS()
+
+    options = dict()
+    def edge_options(u, v):
+        key = (u, v) if u < v else (v, u)
+        if key not in options:
+            options[key] = channel_options(edge_capacities(network, u, v), max_subset_size)
+        return options[key]
+
+    neighbors = dict((node, network.neighbors(node)) for node in network.nodes())
+    label = _rcs_search(neighbors, edge_options, src, dst, consider)
+    if label is None:
         return None
-
-    return network.node[dst]['rcs_paths'][max(network.node[dst]['rcs_paths'].keys())]
+    return label.pcs(network)
+
+def _rcs_search(neighbors, edge_options, src, dst, consider):
+    """
+    The label-setting search of rcs_path() over an adjacency dict and an
+    edge_options(u, v) function. Returns the label that reaches dst, or
+    None.
+    """
+    labels = dict((node, list()) for node in neighbors)
+    root = Label(src)
+    labels[src].append(root)
+    heap = [(-root.throughput, 0, root)]
+    order = 1
+    while heap:
+        bound, _, label = heapq.heappop(heap)
+        if not label.alive:
+            continue
+        if label.node == dst:
+            return label
+
+        with profiling.span('rcs_path.expand', hops=label.hops):
+            for v in neighbors[label.node]:
+                if label.visited >> v & 1:
+                    continue
+                store = labels[v]
+                for total, mask in edge_options(label.node, v):
+                    # Options come largest first, so once one would be the
+                    # first label dropped from a full store, so would the rest
+                    limit = total if label.hops == 0 else min(label.settled, total / 2.0)
+                    if len(store) >= consider and \
+                       limit <= min(other.throughput for other in store):
+                        break
+                    candidate = label.extend(v, (label.node, v), mask, total)
+                    if profiling.enabled:
+                        profiling.count('rcs_path.extensions')
+                    if _add_label(store, candidate, consider):
+                        heapq.heappush(heap, (-candidate.throughput, order, candidate))
+                        order += 1
+
+    return None
+
+class RoutingState:
+    """
+    What rcs_path() needs from a network, computed once so that many
+    (src, dst) pairs can be routed on it: the adjacency of every node and
+    the channel_options() of every edge. It holds only plain lists and
+    dicts, so it is cheap to hand to worker processes.
+    """
+
+    @profiling.profiled('route_many.state')
+    def __init__(self, network, max_subset_size=0):
+        self.max_subset_size = max_subset_size
+        self.neighbors = dict((node, list(network.neighbors(node))) for node in network.nodes())
+        self.options = dict()
+        for u, v in network.edges():
+            key = (u, v) if u < v else (v, u)
+            self.options[key] = channel_options(edge_capacities(network, u, v), max_subset_size)
+
+    def edge_options(self, u, v):
+        return self.options[(u, v) if u < v else (v, u)]
+
+    def route(self, src, dst, consider=10):
+        """
+        (hops, throughput) of the best src to dst path, where hops are
+        (edge, channel mask) pairs, or None when dst cannot be reached.
+        """
+        if src == dst:
+            return [], sys.float_info.max
+        label = _rcs_search(self.neighbors, self.edge_options, src, dst, consider)
+        if label is None:
+            return None
+        return label.hops_and_masks(), label.throughput
+
+# Routing state of a route_many() worker process
+_worker_state = None
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+def _route_pair(job):
+    src, dst, consider = job
+    return _worker_state.route(src, dst, consider)
+
+def route_many(network, pairs, consider=10, max_subset_size=0, processes=None,
+               state=None):
+    """
+    rcs_path() for every (src, dst) pair, as a list of PCS (None for
+    unreachable pairs) in the order of pairs. The per-network work is
+    done once in a RoutingState, which can also be passed in to share it
+    between calls; the searches are spread over a process pool unless
+    processes is 1.
+    """
+    if state is None:
+        state = RoutingState(network, max_subset_size)
+    jobs = [(src, dst, consider) for src, dst in pairs]
+    with profiling.span('route_many.search', pairs=len(jobs)):
+        if processes == 1 or len(jobs) < 2:
+            results = [state.route(*job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(processes, _init_worker, (state,))
+            try:
+                chunksize = max(1, len(jobs) // (4 * (processes or multiprocessing.cpu_count())))
+                results = pool.map(_route_pair, jobs, chunksize)
+            finally:
+                pool.close()
+                pool.join()
+    return [None if result is None else _make_pcs(network, *result) for result in results]
@@ -0,0 +1,191 @@
+#
+# Streaming Metrics
+#
+# Long simulations and experiment sweeps produce one record per slot or per
+# trial: a dict of column name -> scalar, string or fixed-size array. A
+# MetricsSink holds at most chunk_size records at a time and writes them out
+# as one columnar .npz chunk, so memory does not grow with the length of the
+# run. Scalar columns also feed running aggregates (count, mean, standard
+# deviation, min, max and percentiles over a bounded reservoir sample) that
+# can be read at any point.
+#
+
+import os
+import glob
+import json
+import math
+import random
+import numbers
+
+import numpy
+
+PERCENTILES = (50, 90, 99)
+
+class RunningStats:
+    """
+    Constant-memory summary of a stream of numbers. Mean and variance are
+    kept with Welford's update and percentiles come from a uniform
+    reservoir sample of at most reservoir values.
+    """
+
+    def __init__(self, reservoir=4096, seed=0):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.size = reservoir
+        self.sample = list()
+        self.random = random.Random(seed)
+
+    def add(self, value):
+        value = float(value)
+        if math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        if len(self.sample) < self.size:
+            self.sample.append(value)
+        else:
+            k = self.random.randrange(self.count)
+            if k < self.size:
+                self.sample[k] = value
+
+    def percentile(self, q):
+        if not self.sample:
+            return None
+        return float(numpy.percentile(self.sample, q))
+
+    def summary(self, percentiles=PERCENTILES):
+        if self.count == 0:
+            return {'count': 0}
+        result = {'count': self.count, 'mean': self.mean,
+                  'std': math.sqrt(self.m2 / self.count),
+                  'min': self.minimum, 'max': self.maximum}
+        for q in percentiles:
+            result['p%g' % q] = self.percentile(q)
+        return result
+
+def _scalar(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+def _column(values):
+    "Array of one column of a chunk. Missing values become NaN or ''."
+    if any(isinstance(v, str) for v in values):
+        return numpy.array(['' if v is None else v for v in values])
+    if any(v is None for v in values):
+        return numpy.array([numpy.nan if v is None else v for v in values], dtype=float)
+    return numpy.asarray(values)
+
+class MetricsSink:
+    """
+    Write a stream of records into directory as chunk-NNNNNN.npz files of
+    at most chunk_size rows each. A directory that already holds the
+    chunks of an earlier run is refused unless overwrite is set, in which
+    case those chunks and its summary.json are deleted first. Use it as a
+    context manager or call close(), which writes the last partial chunk
+    and summary.json.
+    """
+
+    def __init__(self, directory, chunk_size=4096, reservoir=4096, seed=0,
+                 overwrite=False):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        # Chunks of an earlier run would otherwise be read back with this one
+        existing = glob.glob(os.path.join(directory, "chunk-*.npz"))
+        if existing and not overwrite:
+            raise ValueError("%s already holds the metrics of an earlier run, "
+                             "use overwrite to replace them" % directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        summary = os.path.join(directory, "summary.json")
+        for filename in existing + ([summary] if os.path.exists(summary) else []):
+            os.remove(filename)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.reservoir = reservoir
+        self.seed = seed
+        self.chunks = 0
+        self.rows = 0
+        self.stats = dict()
+        self.buffer = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def write(self, record):
+        "Add one record, writing a chunk when the buffer is full."
+        for name, value in record.items():
+            if _scalar(value):
+                stats = self.stats.get(name)
+                if stats is None:
+                    stats = self.stats[name] = RunningStats(self.reservoir,
+                                                            self.seed + len(self.stats))
+                stats.add(value)
+        self.buffer.append(record)
+        self.rows += 1
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def consume(self, records):
+        "Drain an iterable (typically a generator) of records. Returns the count."
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+    def flush(self):
+        "Write the buffered records as one chunk."
+        if not self.buffer:
+            return
+        names = list()
+        for record in self.buffer:
+            for name in record:
+                if name not in names:
+                    names.append(name)
+        columns = dict((name, _column([record.get(name) for record in self.buffer]))
+                       for name in names)
+        filename = os.path.join(self.directory, "chunk-%06d.npz" % self.chunks)
+        numpy.savez(filename, **columns)
+        self.chunks += 1
+        del self.buffer[:]
+
+    def summary(self, percentiles=PERCENTILES):
+        "Running aggregates of every scalar column."
+        return dict((name, stats.summary(percentiles)) for name, stats in self.stats.items())
+
+    def close(self):
+        self.flush()
+        with open(os.path.join(self.directory, "summary.json"), "w") as out:
+            json.dump({'rows': self.rows, 'chunks': self.chunks,
+                       'columns': self.summary()}, out, indent=1, sort_keys=True)
+
+def read(directory, columns=None):
+    "Yield the chunks of a metrics directory in order, as dicts of arrays."
+    for filename in sorted(glob.glob(os.path.join(directory, "chunk-*.npz"))):
+        with numpy.load(filename) as chunk:
+            names = chunk.files if columns is None else [c for c in columns if c in chunk.files]
+            yield dict((name, chunk[name]) for name in names)
+
+def load(directory, columns=None):
+    "Concatenate every chunk of a metrics directory into one array per column."
+    parts = dict()
+    for chunk in read(directory, columns):
+        for name, values in chunk.items():
+            parts.setdefault(name, list()).append(values)
+    for name, values in parts.items():
+        # A string column that was entirely missing in some chunk was written as NaN
+        if any(v.dtype.kind == 'U' for v in values):
+            values[:] = [v if v.dtype.kind == 'U' else numpy.full(len(v), '') for v in values]
+    return dict((name, numpy.concatenate(values)) for name, values in parts.items())
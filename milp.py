@@ -0,0 +1,246 @@
+#
+#  Mixed Integer Linear Programming Backends
+#
+
+import math
+
+import numpy
+import scipy.sparse
+from scipy.optimize import milp, Bounds, LinearConstraint
+
+class Problem:
+    """
+    A MILP in matrix form:
+
+        maximize (or minimize)  objective . x
+        subject to              row_lb <= matrix . x <= row_ub
+                                lb <= x <= ub
+                                x[k] integer where integrality[k] == 1
+
+    matrix is a scipy.sparse matrix. names are only needed when the
+    problem is written out.
+    """
+
+    def __init__(self, objective, matrix, row_lb, row_ub, lb, ub, integrality,
+                 maximize=True, name="problem", names=None, row_names=None):
+        self.objective = numpy.asarray(objective, dtype=float)
+        self.matrix = scipy.sparse.csr_matrix(matrix)
+        self.row_lb = numpy.asarray(row_lb, dtype=float)
+        self.row_ub = numpy.asarray(row_ub, dtype=float)
+        self.lb = numpy.asarray(lb, dtype=float)
+        self.ub = numpy.asarray(ub, dtype=float)
+        self.integrality = numpy.asarray(integrality, dtype=numpy.int8)
+        self.maximize = maximize
+        self.name = name
+        self.names = names
+        self.row_names = row_names
+
+    def variable_names(self):
+        if self.names is not None:
+            return list(self.names)
+        return ["x%d" % k for k in range(len(self.objective))]
+
+    def constraint_names(self):
+        if self.row_names is not None:
+            return list(self.row_names)
+        return ["c%d" % k for k in range(self.matrix.shape[0])]
+
+class Solution:
+    def __init__(self, objective, x, status, optimal=True):
+        self.objective = objective
+        self.x = x
+        self.status = status
+        self.optimal = optimal
+
+    def __repr__(self):
+        return "<Solution %s %s>" % (self.status, self.objective)
+
+def _mps_number(value):
+    return "%.12g" % value
+
+def write_mps(problem, filename):
+    "Write a problem out in free MPS format."
+    names = problem.variable_names()
+    rows = problem.constraint_names()
+    senses = list()
+    for lo, hi in zip(problem.row_lb, problem.row_ub):
+        if lo == hi:
+            senses.append('E')
+        elif math.isinf(lo):
+            senses.append('L')
+        elif math.isinf(hi):
+            senses.append('G')
+        else:
+            senses.append('R')
+
+    columns = problem.matrix.tocsc()
+    with open(filename, "w") as out:
+        out.write("NAME %s\n" % problem.name)
+        out.write("OBJSENSE\n    %s\n" % ("MAX" if problem.maximize else "MIN"))
+        out.write("ROWS\n N obj\n")
+        for row, sense in zip(rows, senses):
+            out.write(" %s %s\n" % ('L' if sense == 'R' else sense, row))
+
+        out.write("COLUMNS\n")
+        integer = False
+        for k, name in enumerate(names):
+            if problem.integrality[k] and not integer:
+                out.write(" MARKER 'MARKER' 'INTORG'\n")
+                integer = True
+            elif not problem.integrality[k] and integer:
+                out.write(" MARKER 'MARKER' 'INTEND'\n")
+                integer = False
+            if problem.objective[k] != 0.0:
+                out.write(" %s obj %s\n" % (name, _mps_number(problem.objective[k])))
+            start, end = columns.indptr[k], columns.indptr[k + 1]
+            for row, value in zip(columns.indices[start:end], columns.data[start:end]):
+                out.write(" %s %s %s\n" % (name, rows[row], _mps_number(value)))
+        if integer:
+            out.write(" MARKER 'MARKER' 'INTEND'\n")
+
+        out.write("RHS\n")
+        for row, sense, lo, hi in zip(rows, senses, problem.row_lb, problem.row_ub):
+            value = lo if sense == 'G' else hi
+            if value != 0.0:
+                out.write(" rhs %s %s\n" % (row, _mps_number(value)))
+
+        if 'R' in senses:
+            out.write("RANGES\n")
+            for row, sense, lo, hi in zip(rows, senses, problem.row_lb, problem.row_ub):
+                if sense == 'R':
+                    out.write(" rng %s %s\n" % (row, _mps_number(hi - lo)))
+
+        out.write("BOUNDS\n")
+        for name, lo, hi in zip(names, problem.lb, problem.ub):
+            if lo == hi:
+                out.write(" FX bnd %s %s\n" % (name, _mps_number(lo)))
+                continue
+            if math.isinf(lo):
+                out.write(" MI bnd %s\n" % name)
+            elif lo != 0.0:
+                out.write(" LO bnd %s %s\n" % (name, _mps_number(lo)))
+            if not math.isinf(hi):
+                out.write(" UP bnd %s %s\n" % (name, _mps_number(hi)))
+        out.write("ENDATA\n")
+
+class Backend:
+    """
+    Interface of a MILP solver. solve() returns a Solution, or None when
+    no feasible solution was found.
+    """
+
+    name = None
+
+    def solve(self, problem, time_limit=None, mip_gap=None, filename=None):
+        raise NotImplementedError
+
+class HighsBackend(Backend):
+    "Open-source HiGHS solver, through scipy.optimize.milp."
+
+    name = "highs"
+
+    def solve(self, problem, time_limit=None, mip_gap=None, filename=None):
+        if filename is not None:
+            write_mps(problem, filename)
+
+        options = dict()
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+        if mip_gap is not None:
+            options['mip_rel_gap'] = mip_gap
+
+        objective = -problem.objective if problem.maximize else problem.objective
+        constraints = list()
+        if problem.matrix.shape[0] > 0:
+            constraints.append(LinearConstraint(problem.matrix, problem.row_lb, problem.row_ub))
+        result = milp(objective, integrality=problem.integrality,
+                      bounds=Bounds(problem.lb, problem.ub),
+                      constraints=constraints, options=options)
+        if result.x is None:
+            print("Exception raised during solve: ", result.message)
+            return None
+
+        value = float(problem.objective.dot(result.x))
+        return Solution(value, result.x, result.message, optimal=result.status == 0)
+
+class CplexBackend(Backend):
+    "IBM ILOG CPLEX, when the cplex module is installed."
+
+    name = "cplex"
+
+    def solve(self, problem, time_limit=None, mip_gap=None, filename=None):
+        import cplex
+        from cplex.exceptions import CplexSolverError
+
+        model = cplex.Cplex()
+        model.set_problem_name(problem.name)
+        model.set_results_stream(None)
+        model.set_log_stream(None)
+        if time_limit is not None:
+            model.parameters.timelimit.set(time_limit)
+        if mip_gap is not None:
+            model.parameters.mip.tolerances.mipgap.set(mip_gap)
+
+        types = [model.variables.type.integer if k else model.variables.type.continuous
+                 for k in problem.integrality]
+        model.variables.add(obj=problem.objective.tolist(),
+                            lb=[-cplex.infinity if math.isinf(v) else v for v in problem.lb],
+                            ub=[cplex.infinity if math.isinf(v) else v for v in problem.ub],
+                            types=types, names=problem.variable_names())
+        if problem.maximize:
+            model.objective.set_sense(model.objective.sense.maximize)
+
+        rows = list()
+        senses = ""
+        rhs = list()
+        ranges = list()
+        matrix = problem.matrix
+        for k, (lo, hi) in enumerate(zip(problem.row_lb, problem.row_ub)):
+            start, end = matrix.indptr[k], matrix.indptr[k + 1]
+            rows.append(cplex.SparsePair(ind=matrix.indices[start:end].tolist(),
+                                         val=matrix.data[start:end].tolist()))
+            if lo == hi:
+                senses += "E"
+                rhs.append(hi)
+                ranges.append(0.0)
+            elif math.isinf(lo):
+                senses += "L"
+                rhs.append(hi)
+                ranges.append(0.0)
+            elif math.isinf(hi):
+                senses += "G"
+                rhs.append(lo)
+                ranges.append(0.0)
+            else:
+                senses += "R"
+                rhs.append(lo)
+                ranges.append(hi - lo)
+        model.linear_constraints.add(lin_expr=rows, senses=senses, rhs=rhs,
+                                     range_values=ranges,
+                                     names=problem.constraint_names())
+
+        try:
+            if filename is not None:
+                model.write(filename)
+            model.solve()
+            x = numpy.array(model.solution.get_values())
+            status = model.solution.get_status_string()
+            optimal = model.solution.get_status() in (
+                model.solution.status.MIP_optimal, model.solution.status.optimal)
+            return Solution(model.solution.get_objective_value(), x, status, optimal)
+        except CplexSolverError as e:
+            print("Exception raised during solve: ", e)
+            return None
+
+backends = {
+    HighsBackend.name : HighsBackend,
+    CplexBackend.name : CplexBackend
+}
+
+def get_backend(backend=None):
+    "Backend instance from a name, an instance or None for the default (HiGHS)."
+    if backend is None:
+        return HighsBackend()
+    if isinstance(backend, Backend):
+        return backend
+    return backends[backend]()
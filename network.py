@@ -7,11 +7,19 @@ import math
 import time
 import random
 import pprint
-from collections import OrderedDict, defaultdict
+from collections import defaultdict
 
+import numpy
 import networkx
+from scipy.spatial import cKDTree
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import profiling
+from channels import ChannelStore, edge_key
+from interference import InterferenceGraph
 
 verbose = False
 
@@ -33,6 +41,273 @@ signal_range = {
     5.8 : 3.6
 }
 
+# Pathloss tiers (dB); a link whose pathloss exceeds the i-th tier gets
+# tier_throughput[i + 1], and tier_throughput[0] below the first one.
+pathloss_tiers = (113.0, 114.5, 118.75, 121.5, 126.0)
+tier_throughput = (45 * math.pow(10,6), 40 * math.pow(10,6),
+                   30 * math.pow(10,6), 20 * math.pow(10,6),
+                   10 * math.pow(10,6), 0.0)
+
+class Geometry:
+    """
+    Node positions held as an (N x 2) array, indexed by node. The pairwise
+    distance, bearing, pathloss and tier matrices are computed lazily in
+    one vectorized pass and cached until invalidated. With dense=True
+    single lookups and blocks index those matrices; with dense=False they
+    are computed from the coordinates, so nothing N x N is built unless a
+    full matrix is asked for. Both give identical values.
+    """
+
+    def __init__(self, positions, receiver_gain, dense=True):
+        self.positions = numpy.asarray(positions, dtype=float)
+        self.receiver_gain = numpy.asarray(receiver_gain, dtype=float)
+        self.dense = dense
+        self.invalidate()
+
+    def invalidate(self):
+        "Drop every cached matrix, e.g. after positions or gains change."
+        self._distances = None
+        self._bearings = None
+        self._pathloss = dict()
+        self._tiers = dict()
+        self._tree = None
+
+    def tree(self):
+        "KD-tree spatial index over the node positions."
+        if self._tree is None:
+            self._tree = cKDTree(self.positions)
+        return self._tree
+
+    def within(self, point, radius):
+        "Indices of the positions strictly closer than radius to point."
+        candidates = numpy.asarray(self.tree().query_ball_point(point, radius), dtype=numpy.intp)
+        if len(candidates) == 0:
+            return candidates
+        delta = self.positions[candidates] - numpy.asarray(point, dtype=float)
+        return candidates[numpy.hypot(delta[:, 0], delta[:, 1]) < radius]
+
+    def pairs_within(self, radius):
+        "(K x 2) array of index pairs i < j strictly closer than radius."
+        pairs = self.tree().query_pairs(radius, output_type='ndarray')
+        pairs = pairs.reshape(-1, 2).astype(numpy.intp)
+        delta = self.positions[pairs[:, 0]] - self.positions[pairs[:, 1]]
+        return pairs[numpy.hypot(delta[:, 0], delta[:, 1]) < radius]
+
+    # Kernels over index arrays i and j, broadcast against each other
+
+    def _distance(self, i, j):
+        p = self.positions
+        return numpy.hypot(p[i, 0] - p[j, 0], p[i, 1] - p[j, 1])
+
+    def _bearing(self, i, j):
+        p = self.positions
+        distance = self._distance(i, j) * 1000
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            angle = numpy.degrees(numpy.arccos((p[j, 1] - p[i, 1]) / distance))
+        return numpy.where(p[j, 0] > p[i, 0], angle, 360.0 - angle)
+
+    def _loss(self, i, j, theta, freq):
+        distance = self._distance(i, j) * 1000
+        gain = math.pow(10, (2 + 10 * math.log10(360.0/theta))/10.0)
+        gain *= math.pow(wavelength[freq], 2)
+        with numpy.errstate(divide='ignore'):
+            pathloss = gain * self.receiver_gain[j]
+            pathloss = pathloss / numpy.square(4 * math.pi * distance)
+            return numpy.fabs(10 * numpy.log10(pathloss))
+
+    def _tier(self, i, j, theta, freq):
+        distance = self._distance(i, j) * 1000
+        scaled = distance / numpy.sqrt(self.receiver_gain[j])
+        tiers = numpy.searchsorted(self.tier_distances(theta, freq), scaled, side='left')
+        return numpy.where(distance == 0.0, len(pathloss_tiers), tiers).astype(numpy.uint8)
+
+    def _grid(self):
+        index = numpy.arange(len(self.positions))
+        return index[:, None], index[None, :]
+
+    def distances(self):
+        "Pairwise distances (km) between all nodes."
+        if self._distances is None:
+            self._distances = self._distance(*self._grid())
+        return self._distances
+
+    def bearings(self):
+        "Pairwise bearings (degrees) from row node to column node."
+        if self._bearings is None:
+            self._bearings = self._bearing(*self._grid())
+        return self._bearings
+
+    def pathloss(self, theta=360.0, freq=2.4):
+        "Pairwise pathloss (dB) from row node to column node."
+        key = (theta, freq)
+        if key not in self._pathloss:
+            self._pathloss[key] = self._loss(*self._grid(), theta=theta, freq=freq)
+        return self._pathloss[key]
+
+    def tier_distances(self, theta=360.0, freq=2.4):
+        """
+        Distance (m) at which the pathloss crosses each of the pathloss
+        tiers, for a receiver with unit gain. Pathloss is monotonic in
+        distance, so the tiers can be compared in distance space.
+        """
+        gain = math.pow(10, (2 + 10 * math.log10(360.0/theta))/10.0)
+        gain *= math.pow(wavelength[freq], 2)
+        tiers = numpy.power(10.0, numpy.asarray(pathloss_tiers) / 10.0)
+        return numpy.sqrt(gain * tiers) / (4 * math.pi)
+
+    def tiers(self, theta=360.0, freq=2.4):
+        "Pairwise throughput tier index from row node to column node."
+        key = (theta, freq)
+        if key not in self._tiers:
+            self._tiers[key] = self._tier(*self._grid(), theta=theta, freq=freq)
+        return self._tiers[key]
+
+    def reach(self, frequencies, theta=360.0):
+        """
+        Distance (km) beyond which no pair of nodes has throughput on any
+        of the frequencies.
+        """
+        gain = math.sqrt(self.receiver_gain.max()) if len(self.receiver_gain) else 1.0
+        return max(self.tier_distances(theta, freq)[-1] for freq in frequencies) * gain / 1000.0
+
+    # Lookups of single pairs (or equal length index arrays) and blocks
+
+    def distance(self, i, j):
+        if self.dense:
+            return self.distances()[i, j]
+        return self._distance(i, j)
+
+    def bearing(self, i, j):
+        if self.dense:
+            return self.bearings()[i, j]
+        return self._bearing(i, j)
+
+    def pathloss_between(self, i, j, theta=360.0, freq=2.4):
+        if self.dense:
+            return self.pathloss(theta, freq)[i, j]
+        return self._loss(i, j, theta, freq)
+
+    def tier(self, i, j, theta=360.0, freq=2.4):
+        if self.dense:
+            return self.tiers(theta, freq)[i, j]
+        return self._tier(i, j, theta, freq)
+
+    def bearing_block(self, rows, columns):
+        "Bearings from every node in rows to every node in columns."
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        columns = numpy.asarray(columns, dtype=numpy.intp)
+        if self.dense:
+            return self.bearings()[numpy.ix_(rows, columns)]
+        return self._bearing(rows[:, None], columns[None, :])
+
+    def tier_block(self, rows, columns, theta=360.0, freq=2.4):
+        "Tiers from every node in rows to every node in columns."
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        columns = numpy.asarray(columns, dtype=numpy.intp)
+        if self.dense:
+            return self.tiers(theta, freq)[numpy.ix_(rows, columns)]
+        return self._tier(rows[:, None], columns[None, :], theta, freq)
+
+class ThroughputAccountant:
+    """
+    Directional throughput of every edge at the network's beam width,
+    cached per edge, with the in/out throughput of the nodes and the
+    network total updated incrementally as edges are added and removed.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.edges = dict()
+        self.total = 0.0
+
+    def add(self, u, v):
+        "Account for edge (u, v), refreshing it if it is already known."
+        self.remove(u, v)
+        network = self.network
+        forward = network.throughput(u, v, theta=network.theta)
+        backward = network.throughput(v, u, theta=network.theta)
+        key = edge_key(u, v)
+        if key != (u, v):
+            forward, backward = backward, forward
+        self.edges[key] = (forward, backward)
+        self._update(key, forward, backward, 1.0)
+
+    def add_many(self, u, v, forward, backward):
+        """
+        Account for new edges (u[k], v[k]) with u[k] < v[k], given their
+        throughput in each direction as arrays.
+        """
+        self.edges.update(zip(zip(u.tolist(), v.tolist()),
+                              zip(forward.tolist(), backward.tolist())))
+        size = len(self.network.geometry.positions)
+        out_throughput = (numpy.bincount(u, forward, size) +
+                          numpy.bincount(v, backward, size))
+        in_throughput = (numpy.bincount(u, backward, size) +
+                         numpy.bincount(v, forward, size))
+        for n in numpy.flatnonzero(out_throughput + in_throughput).tolist():
+            node = self.network.node[n]
+            node['out_throughput'] += out_throughput[n]
+            node['in_throughput'] += in_throughput[n]
+            node['throughput'] = node['in_throughput'] + node['out_throughput']
+        self.total += 2.0 * float(forward.sum() + backward.sum())
+
+    def remove(self, u, v):
+        "Stop accounting for edge (u, v)."
+        key = edge_key(u, v)
+        if key in self.edges:
+            forward, backward = self.edges.pop(key)
+            self._update(key, forward, backward, -1.0)
+
+    def rebuild(self):
+        "Recompute everything from scratch, e.g. after theta changes."
+        for n in self.network:
+            node = self.network.node[n]
+            node['in_throughput'] = 0.0
+            node['out_throughput'] = 0.0
+            node['throughput'] = 0.0
+        self.edges = dict()
+        self.total = 0.0
+        for u, v in self.network.edges():
+            self.add(u, v)
+
+    def _update(self, key, forward, backward, sign):
+        u = self.network.node[key[0]]
+        v = self.network.node[key[1]]
+        u['out_throughput'] += sign * forward
+        u['in_throughput'] += sign * backward
+        v['out_throughput'] += sign * backward
+        v['in_throughput'] += sign * forward
+        u['throughput'] = u['in_throughput'] + u['out_throughput']
+        v['throughput'] = v['in_throughput'] + v['out_throughput']
+        self.total += sign * 2.0 * (forward + backward)
+
+class EdgeData(dict):
+    """
+    Attribute dictionary of a network edge. Its 'channels' table is
+    materialized by the network on first access, through e['channels']
+    or e.get('channels'), so edges that are never read never pay for it.
+    """
+
+    __slots__ = ('network', 'edge')
+
+    def __init__(self, network, u, v, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.network = network
+        self.edge = (u, v)
+
+    def __missing__(self, key):
+        if key != 'channels':
+            raise KeyError(key)
+        channels = self.network.materialize_channels(*self.edge)
+        self['channels'] = channels
+        return channels
+
+    def get(self, key, default=None):
+        "Like dict.get, but materializes the 'channels' table like e['channels']."
+        if key == 'channels':
+            return self[key]
+        return dict.get(self, key, default)
+
 class Network(networkx.graph.Graph):
     """
     Network class. Base of all simulation parts.
@@ -40,26 +315,32 @@ class Network(networkx.graph.Graph):
 
     FREQUENCIES = ( 700, 2.4, 5.8 )
 
+    @profiling.profiled('network.construction')
     def __init__(self, seed=None, width=20.0, height=20.0, 
                  number_of_nodes=10, relays=2, radial=False, 
                  sectors=8, theta=30.0, meanq=40000.0, slot_length=0.001, 
-                 channels=4, channel_probability=0.3):
+                 channels=4, channel_probability=0.3, compact=False,
+                 sparse=False):
         """
         Create a network that spans a given size and number of nodes.
+        With compact=True edge channel capacities live in a single
+        ChannelStore tensor instead of per-edge dictionaries.
+
+        With sparse=True the complete graph is never built: only pairs of
+        nodes within reach of each other (some frequency has throughput
+        between them) get an edge, found with a spatial query, and no
+        N x N geometry matrix is cached. Apart from the relay skeleton,
+        those are exactly the edges that survive prune_dead_edges()
+        before interference, so memory and time grow with the number of
+        viable links instead of N^2. Radial networks only have the relay
+        skeleton in either mode.
         """
         if not seed:
             seed = int(time.time()*1000000)
 
-        # Super initialization 
-        G = networkx.complete_graph(number_of_nodes) 
-
-        if not radial:
-            networkx.graph.Graph.__init__(self, data=G, width=width,
-                                          height=height, seed=seed)
-        else:
-            networkx.graph.Graph.__init__(self, width=width, height=height,
-                                          seed=seed)
-            self.add_nodes_from(G.nodes())
+        # Super initialization; edges are added in bulk once positions are known
+        networkx.graph.Graph.__init__(self, width=width, height=height, seed=seed)
+        self.add_nodes_from(range(number_of_nodes))
  
         # Set attributes
         self.width = width
@@ -73,11 +354,22 @@ class Network(networkx.graph.Graph):
         self.channels = channels
         self.channel_probability = channel_probability
         self.radial = radial
+        self.sparse = sparse
         self.position = dict()
         self.relays = set()
+        # Order relays were added in; it fixes the set's iteration order
+        self.relay_order = list()
         self.subscribers = set()
-        self.interference = defaultdict(lambda: defaultdict(dict))
+        self.interference = None
         self.beamset = defaultdict(lambda: defaultdict(dict))
+        self.beam_interval = defaultdict(dict)
+        self.channel_store = None
+        if compact:
+            self.channel_store = ChannelStore(self.FREQUENCIES, channels)
+        self.accountant = ThroughputAccountant(self)
+        self.blocked = numpy.zeros((number_of_nodes, len(self.FREQUENCIES), channels),
+                                   dtype=bool)
+        self._materialized = set()
 
         # Distribute the nodes randomly throughout the space
         self.node[0]['type'] = 0
@@ -108,54 +400,225 @@ class Network(networkx.graph.Graph):
             self.node[node]['location_x'] = location_x
             self.node[node]['location_y'] = location_y
 
+        self.geometry = Geometry(
+            [self.position[node] for node in range(number_of_nodes)],
+            [self.node[node]['receiver_gain'] for node in range(number_of_nodes)],
+            dense=not sparse)
+
         while relays > 0:
             node = random.choice(self.nodes())
             if self.node[node]['type'] not in [0,1]:
                 self.node[node]['type'] = 1
                 self.relays.add(node)
+                self.relay_order.append(node)
                 relays = relays - 1
 
         for node in self:
             if self.node[node]['type'] == 2:
                 self.subscribers.add(node)
 
+        # Radial networks only have the relay skeleton, sparse or not
+        if sparse and not radial:
+            with profiling.span('network.reachable_edges'):
+                self.add_reachable_edges()
+        elif not radial:
+            # The complete graph
+            with profiling.span('network.init_edges'):
+                self.add_edge_arrays(*numpy.triu_indices(number_of_nodes, 1))
+
         # Relays have a skeleton
-        for relay in self.relays:
+        skeleton = [relay for relay in self.relays if not self.has_edge(0, relay)]
+        for relay in skeleton:
             self.add_edge(0, relay)
+            self.init_edge(0, relay)
 
-        # Populate Edge data
-        for edge in self.edges():
-            self.init_edge(edge[0], edge[1])
-
+    def add_reachable_edges(self):
+        """
+        Add, and initialize in bulk, an edge between every pair of nodes
+        not yet joined that has throughput in either direction on some
+        frequency at full beam width. Returns the number of edges added.
+        """
+        geometry = self.geometry
+        pairs = geometry.pairs_within(geometry.reach(self.FREQUENCIES))
+        u, v = pairs[:, 0], pairs[:, 1]
+        unreachable = len(pathloss_tiers)
+        viable = numpy.zeros(len(pairs), dtype=bool)
+        for freq in self.FREQUENCIES:
+            viable |= geometry.tier(u, v, freq=freq) != unreachable
+            viable |= geometry.tier(v, u, freq=freq) != unreachable
+        if self.number_of_edges():
+            viable &= numpy.array([not self.has_edge(a, b) for a, b in pairs.tolist()],
+                                  dtype=bool)
+        return self.add_edge_arrays(u[viable], v[viable])
+
+    def add_edge_arrays(self, u, v):
+        """
+        Add and initialize edges (u[k], v[k]) with u[k] < v[k], none of
+        them present yet, in bulk: the edge data is created directly and
+        the throughput accountant is updated once. Returns the number of
+        edges added.
+        """
+        u = numpy.asarray(u, dtype=numpy.intp)
+        v = numpy.asarray(v, dtype=numpy.intp)
+        geometry = self.geometry
+        distances = geometry.distance(u, v)
+        for a, b, distance in zip(u.tolist(), v.tolist(), numpy.asarray(distances).tolist()):
+            e = EdgeData(self, a, b, distance=distance)
+            self.adj[a][b] = e
+            self.adj[b][a] = e
+
+        theta = self.theta
+        forward = numpy.take(tier_throughput, geometry.tier(u, v, theta))
+        backward = numpy.take(tier_throughput, geometry.tier(v, u, theta))
+        self.accountant.add_many(u, v, forward, backward)
+        return len(u)
+
+    @profiling.profiled('network.initialize_edges')
     def initialize_edges(self):
         self.generate_primary_interference()
 
         # Remove dead edges
-        for e in self.edges():
-            if self.bottleneck_capacity(e) == 0.0:
-                self.remove_edge(*e)
+        self.prune_dead_edges()
 
         # Remove dead nodes
         for n in self.nodes():
             if len(self.neighbors(n)) == 0:
                 self.remove_node(n)
 
+        self.build_interference()
+
     def init_edge(self, src, dst):
-        e = self[src][dst]
-        e['channels'] = dict()
+        """
+        Set up the data of edge (src, dst). Its channel table is left to
+        be materialized on first access.
+        """
+        e = EdgeData(self, src, dst, self.adj[src][dst])
+        e.pop('channels', None)
         e['distance'] = self.distance(src, dst)
-        for freq in self.FREQUENCIES:
-            e['channels'][freq] = dict()
-            for chan in range(self.channels):
-                e['channels'][freq][chan] = self.throughput(src, dst, freq=freq)
+        self.adj[src][dst] = e
+        self.adj[dst][src] = e
+        self._forget_channels(src, dst)
+        self.accountant.add(src, dst)
+
+    def channel_capacities(self, edges):
+        """
+        (edges, frequencies, channels) capacities of a sequence of edges:
+        the throughput of each frequency from the first node to the
+        second, on every channel that primary interference has not blocked
+        at either end.
+        """
+        edges = numpy.asarray(edges, dtype=numpy.intp).reshape(-1, 2)
+        u, v = edges[:, 0], edges[:, 1]
+        throughput = numpy.zeros((len(edges), len(self.FREQUENCIES)))
+        for f, freq in enumerate(self.FREQUENCIES):
+            throughput[:, f] = numpy.take(tier_throughput, self.geometry.tier(u, v, freq=freq))
+        return throughput[:, :, None] * ~(self.blocked[u] | self.blocked[v])
+
+    def materialize_channels(self, u, v):
+        "Compute the channel table of edge (u, v), stored or as nested dicts."
+        capacities = self.channel_capacities([(u, v)])[0]
+        self._materialized.add(edge_key(u, v))
+        if self.channel_store is not None:
+            return self.channel_store.fill(u, v, capacities)
+        return dict((freq, dict(enumerate(capacities[f].tolist())))
+                    for f, freq in enumerate(self.FREQUENCIES))
+
+    def invalidate_channels(self):
+        """
+        Drop every materialized channel table, after node positions or
+        interference change. Tables are recomputed on their next access.
+        """
+        for u, v in self._materialized:
+            if self.has_edge(u, v):
+                self.adj[u][v].pop('channels', None)
+            if self.channel_store is not None:
+                self.channel_store.remove(u, v)
+        self._materialized = set()
+
+    def _forget_channels(self, u, v):
+        self._materialized.discard(edge_key(u, v))
+        if self.channel_store is not None:
+            self.channel_store.remove(u, v)
+
+    def add_edge(self, u, v, attr_dict=None, **attr):
+        new = not self.has_edge(u, v)
+        networkx.graph.Graph.add_edge(self, u, v, attr_dict, **attr)
+        if new:
+            self.accountant.add(u, v)
+
+    def add_edges_from(self, ebunch, attr_dict=None, **attr):
+        ebunch = list(ebunch)
+        new = set(edge_key(e[0], e[1]) for e in ebunch if not self.has_edge(e[0], e[1]))
+        networkx.graph.Graph.add_edges_from(self, ebunch, attr_dict, **attr)
+        for u, v in new:
+            self.accountant.add(u, v)
+
+    def remove_edge(self, u, v):
+        networkx.graph.Graph.remove_edge(self, u, v)
+        self.accountant.remove(u, v)
+        self._forget_channels(u, v)
+
+    def remove_edges_from(self, ebunch):
+        for e in ebunch:
+            if self.has_edge(e[0], e[1]):
+                self.remove_edge(e[0], e[1])
+
+    def remove_node(self, n):
+        if n in self:
+            for neighbor in self.adj[n]:
+                self.accountant.remove(n, neighbor)
+                self._forget_channels(n, neighbor)
+        networkx.graph.Graph.remove_node(self, n)
+
+    def remove_nodes_from(self, nodes):
+        for n in list(nodes):
+            if n in self:
+                self.remove_node(n)
+
+    def clear(self):
+        for u, v in list(self._materialized):
+            self._forget_channels(u, v)
+        networkx.graph.Graph.clear(self)
+        self.accountant.edges = dict()
+        self.accountant.total = 0.0
+
+    def retain_edges(self, edges):
+        """
+        Remove every edge that is not in edges in one pass. The adjacency
+        is rebuilt from the kept edges and the throughput accounting from
+        scratch, so the cost follows the number of kept edges rather than
+        the number removed. Returns the number of edges removed.
+        """
+        keep = defaultdict(dict)
+        for u, v in edges:
+            if self.has_edge(u, v):
+                data = self.adj[u][v]
+                keep[u][v] = data
+                keep[v][u] = data
+        removed = self.number_of_edges() - sum(len(k) for k in keep.values()) // 2
+        for n in self.adj:
+            self.adj[n] = keep.get(n, dict())
+        for u, v in list(self._materialized):
+            if not self.has_edge(u, v):
+                self._forget_channels(u, v)
+        self.accountant.rebuild()
+        return removed
 
     def prune_dead_edges(self):
-        for e in self.edges():
-            if self.bottleneck_capacity(e) == 0.0:
-                self.remove_edge(*e)
+        for e in self.dead_edges():
+            self.remove_edge(*e)
+
+    def dead_edges(self):
+        "Edges with no capacity left on any frequency or channel."
+        edges = self.edges()
+        totals = self.channel_capacities(edges).sum(axis=(1, 2))
+        return [e for e, total in zip(edges, totals.tolist()) if total == 0.0]
 
     def save(self, filename="graph.graphml"):
-        "Write out the graph to a graphml file."
+        """
+        Write out the graph to a graphml file. snapshot.save() writes a
+        binary snapshot that round-trips everything and loads quickly.
+        """
         networkx.write_graphml(self, filename, prettyprint=True)
 
     def draw(self):
@@ -175,53 +638,75 @@ class Network(networkx.graph.Graph):
         networkx.draw_networkx_edge_labels(self, self.position, 
                       edge_labels=edge_labels)
 
+    def render(self, filename=None, capacity=True, labels=False, max_edges=100000,
+               size=(8.0, 8.0), dpi=100):
+        """
+        Draw the network headless, without pyplot, and write it to filename
+        (PNG, SVG, PDF, ... by extension) when one is given. Edges are one
+        LineCollection, coloured by their total capacity unless capacity is
+        False, and nodes one scatter sized by throughput and coloured by
+        type. Beyond max_edges only every k-th edge is drawn. Edge labels
+        as in draw() are added when labels is True. Returns the Figure.
+        """
+        figure = Figure(figsize=size, dpi=dpi)
+        FigureCanvasAgg(figure)
+        axes = figure.add_subplot(1, 1, 1)
+        axes.set_aspect('equal')
+        positions = self.geometry.positions
+
+        edges = numpy.array(self.edges(), dtype=numpy.intp).reshape(-1, 2)
+        if len(edges) > max_edges:
+            edges = edges[::int(math.ceil(len(edges) / float(max_edges)))]
+        lines = LineCollection(positions[edges], linewidths=0.5, zorder=1)
+        if capacity and len(edges) > 0:
+            totals = self.channel_capacities(edges).sum(axis=(1, 2)) / math.pow(10,6)
+            lines.set_array(totals)
+            lines.set_cmap('viridis')
+            figure.colorbar(lines, ax=axes, label="capacity (mbps)")
+        else:
+            lines.set_color('0.6')
+        axes.add_collection(lines)
+
+        # Marker area shrinks with the node count so large networks stay legible
+        nodes = numpy.array(self.nodes(), dtype=numpy.intp)
+        largest = 400.0 * min(1.0, 100.0 / max(len(nodes), 1))
+        throughput = numpy.array([self.node[n]['throughput'] for n in nodes.tolist()])
+        if len(nodes) > 0 and throughput.max() > 0:
+            throughput = throughput / throughput.max() * largest
+        node_type = [float(self.node[n]['type']) for n in nodes.tolist()]
+        axes.scatter(positions[nodes, 0], positions[nodes, 1],
+                     s=numpy.maximum(throughput, largest / 100.0),
+                     c=node_type, cmap='coolwarm', vmin=0.0, vmax=2.0, zorder=2)
+
+        if labels:
+            for u, v in edges.tolist():
+                x, y = (positions[u] + positions[v]) / 2.0
+                axes.text(x, y, "%0.2f km : %0.1f mbps" % (self[u][v]['distance'],
+                          self.bottleneck_capacity((u, v)) / math.pow(10,6)),
+                          fontsize=6, ha='center', va='center', zorder=3)
+
+        axes.autoscale_view()
+        if filename is not None:
+            figure.savefig(filename, dpi=dpi)
+        return figure
+
     def distance(self, from_node, to_node):
-        x1 = self.node[from_node]['location_x']
-        y1 = self.node[from_node]['location_y']
-        x2 = self.node[to_node]['location_x']
-        y2 = self.node[to_node]['location_y']
-        distance = math.sqrt(math.pow((x1-x2),2) + math.pow((y1-y2),2))
-        return distance
+        return float(self.geometry.distance(from_node, to_node))
 
     def bearing(self, from_node, to_node):
-        x1 = self.node[from_node]['location_x']
-        y1 = self.node[from_node]['location_y']
-        x2 = self.node[to_node]['location_x']
-        y2 = self.node[to_node]['location_y']
-        distance = self.distance(from_node, to_node) * 1000
-        angle = math.degrees(math.acos((y2-y1)/distance))
-        if x2 > x1:
-            return angle
-        else:
-            return 360.0 - angle
+        return float(self.geometry.bearing(from_node, to_node))
 
     def pathloss(self, from_node, to_node, theta=360.0, freq=2.4):
-        distance = self.distance(from_node, to_node) * 1000
-        pathloss = math.pow(10, (2 + 10 * math.log10(360.0/theta))/10.0)
-        pathloss *= self.node[to_node]['receiver_gain']
-        pathloss *= math.pow(wavelength[freq], 2)
-        pathloss /= math.pow(4 * math.pi * distance, 2)
-        pathloss = math.fabs(10 * math.log10(pathloss))
-
-        return pathloss
+        return float(self.geometry.pathloss_between(from_node, to_node, theta, freq))
 
     def throughput(self, from_node, to_node, theta=360.0, freq=2.4):
-        pathloss = self.pathloss(from_node, to_node, theta=theta, freq=freq)
-
-        if pathloss > 126.0:
-            throughput = 0.0
-        elif pathloss > 121.5:
-            throughput = 10 * math.pow(10,6)
-        elif pathloss > 118.75:
-            throughput = 20 * math.pow(10,6)
-        elif pathloss > 114.5:
-            throughput = 30 * math.pow(10,6)
-        elif pathloss > 113:
-            throughput = 40 * math.pow(10,6)
-        else:
-            throughput = 45 * math.pow(10,6)
+        if profiling.enabled:
+            profiling.count('throughput')
+        return tier_throughput[self.geometry.tier(from_node, to_node, theta, freq)]
 
-        return throughput
+    def throughput_matrix(self, theta=360.0, freq=2.4):
+        "Throughput between every pair of nodes, from row node to column node."
+        return numpy.take(tier_throughput, self.geometry.tiers(theta, freq))
 
     def beam_covers(self, from_node, to_node, theta):
         bearing = self.bearing(from_node, to_node)
@@ -234,6 +719,8 @@ class Network(networkx.graph.Graph):
             return False
 
     def bottleneck_capacity(self, edge):
+        if self.channel_store is not None:
+            return self.channel_store.total(self[edge[0]][edge[1]]['channels'].row)
         total_capacity = 0.0
         e = self[edge[0]][edge[1]]
         for frequency in e['channels'].keys():
@@ -247,80 +734,97 @@ class Network(networkx.graph.Graph):
         max_possible *= self.channels # channels
         return(max_possible - (1.0 * self.bottleneck_capacity(edge)))
         
+    def nodes_within(self, point, radius):
+        "Nodes strictly closer than radius (km) to an (x, y) point."
+        return [n for n in self.geometry.within(point, radius).tolist() if n in self]
+
+    @profiling.profiled('network.primary_interference')
     def generate_primary_interference(self):
-        for i in range(len(self.nodes()) * self.channels):
-            src = random.choice(self.nodes())
-            rand_freq = random.choice(list(signal_range.keys()))
+        nodes = self.nodes()
+        frequencies = list(signal_range.keys())
+        for i in range(len(nodes) * self.channels):
+            src = random.choice(nodes)
+            rand_freq = random.choice(frequencies)
             rand_channel = random.randint(0, self.channels-1)
             ns_range = signal_range[rand_freq]
-            for dst in self.nodes():
-                if self.distance(src, dst) < ns_range:
-                    for e in networkx.edges(self, [dst]):
-                        self[e[0]][e[1]]['channels'][rand_freq][rand_channel] = 0.0
+            near = self.nodes_within(self.position[src], ns_range)
+            self.blocked[near, self.FREQUENCIES.index(rand_freq), rand_channel] = True
+        self.invalidate_channels()
 
     def update_node_throughput(self):
-        total_throughput = 0.0
-        for n in self.nodes():
-            neighbors = self.neighbors(n)
-            for neighbor in neighbors:
-                node_to_neighbor = self.throughput(n, neighbor, theta=self.theta)
-                neighbor_to_node = self.throughput(neighbor, n, theta=self.theta)
-                node = self.node[n]                    
-                neighbor = self.node[neighbor]
-                node['in_throughput'] += neighbor_to_node
-                node['out_throughput'] += node_to_neighbor
-                total_throughput += node_to_neighbor + neighbor_to_node
-                node['throughput'] = node['in_throughput'] + node['out_throughput']
-        return total_throughput
-
-    def interference(self):
-        for edge1 in self.edges():
-            for edge2 in self.edges():
-                if edge1 != edge2:
-                    v1e1 = edge1[0]
-                    v2e1 = edge1[1]
-                    v1e2 = edge2[0]
-                    v2e2 = edge2[1]
-                    distances = [ self.distance(v1e1, v1e2),
-                                  self.distance(v1e1, v2e2),
-                                  self.distance(v1e2, v1e2),
-                                  self.distance(v1e2, v2e2) ]
-                    distances.sort()
-                    shortest = distances[0]
-                    vertices = set([v1e1, v2e1, v1e2, v2e2])
-
-                    for i in self.FREQUENCIES:
-                        for j in range(self.channels):
-                            if self[edge1[0]][edge1[1]]['channels'][i][j] > 0.0 and self[edge2[0]][edge2[1]]['channels'][i][j] > 0.0:
-                                if shortest < signal_range[i] or len(vertices) < 4:
-                                    self.interference[edge1][edge2][i][j] = True
-                                    self.interference[edge2][edge1][i][j] = True
-                                else:
-                                    self.interference[edge1][edge2][i][j] = False
-                                    self.interference[edge2][edge1][i][j] = False
-
-    def beamsets(self):
-        relay_bearings = OrderedDict()
+        """
+        Total throughput over all nodes. Node in/out throughput is kept up
+        to date by the throughput accountant as edges change, so this is
+        O(1).
+        """
+        return self.accountant.total
+
+    @profiling.profiled('network.build_interference')
+    def build_interference(self):
+        "Build the link interference graph of the current edges."
+        self.interference = InterferenceGraph(self, signal_range)
+        return self.interference
+
+    @profiling.profiled('network.beamsets')
+    def beamsets(self, resolution=1.0):
+        """
+        Find the distinct, maximal sets of subscribers that a beam of width
+        theta from each relay can cover. Subscriber bearings are sorted once
+        per relay and swept with a two-pointer window (wrapping around 360
+        degrees), so only windows that are not contained in their
+        predecessor are emitted. beamset[relay] maps a beam bearing, a
+        multiple of resolution, to its subscribers and beam_interval[relay]
+        maps it to the open interval of bearings covering the same set.
+        """
+        subscribers = numpy.array(sorted(self.subscribers), dtype=numpy.intp)
+        unreachable = len(pathloss_tiers)
+        width = self.theta / 2.0
+
         for relay in self.relays:
-            relay_bearings[relay] = OrderedDict()
-            for subscriber in self.subscribers:
-                bearing = self.bearing(relay, subscriber)
-                throughput = self.throughput(relay, subscriber,
-                                                       self.theta)
-                if throughput > 0.0:
-                     relay_bearings[relay][bearing] = subscriber
-            
-            sorted_subscribers = relay_bearings[relay]
-            
-            for bearing in range(360):
-                right = (bearing + self.theta / 2) % 360
-                left = (bearing - self.theta / 2) % 360
-                beamset = set()
-                for b,s in sorted_subscribers.items():
-                    if b > left and b < right:
-                        beamset.add(s)
-                if len(beamset) > 0:
-                    self.beamset[relay][bearing] = beamset
+            self.beamset[relay].clear()
+            self.beam_interval[relay].clear()
+            tiers = self.geometry.tier_block([relay], subscribers, self.theta)[0]
+            reachable = subscribers[tiers != unreachable]
+            if len(reachable) == 0:
+                continue
+            bearings = self.geometry.bearing_block([relay], reachable)[0]
+            order = numpy.argsort(bearings, kind='stable')
+            members = reachable[order].tolist()
+            bearing = bearings[order]
+            count = len(bearing)
+
+            if self.theta >= 360.0:
+                self.beamset[relay][0.0] = set(members)
+                self.beam_interval[relay][0.0] = (0.0, 360.0)
+                continue
+
+            # Last subscriber (in the unrolled circle) inside each window
+            unrolled = numpy.concatenate((bearing, bearing + 360.0))
+            first = numpy.arange(count)
+            last = numpy.searchsorted(unrolled, bearing + self.theta, side='left') - 1
+            last = numpy.minimum(last, first + count - 1)
+            previous = numpy.roll(last, 1)
+            previous[0] -= count
+            maximal = last > previous
+
+            everyone = last - first + 1 == count
+            if everyone.any():
+                # A single window covers every subscriber; keep its widest placement
+                spans = numpy.where(everyone, bearing - unrolled[last], -numpy.inf)
+                maximal = first == numpy.argmax(spans)
+
+            for i in first[maximal].tolist():
+                j = int(last[i])
+                low = unrolled[j] - width
+                high = bearing[i] + width
+                center = round((low + high) / 2.0 / resolution) * resolution
+                if not low < center < high:
+                    center = (math.floor(low / resolution) + 1) * resolution
+                    if center >= high:
+                        continue
+                key = round(center % 360.0, 9)
+                self.beamset[relay][key] = set(members[k % count] for k in range(i, j + 1))
+                self.beam_interval[relay][key] = (low % 360.0, low % 360.0 + (high - low))
 
     def beam_index(self, src, dst, beams=8):
         bearing = self.bearing(src, dst)
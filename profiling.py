@@ -0,0 +1,110 @@
+#
+# Phase Profiling
+#
+# Opt-in spans and counters for the toolkit's major phases, exported as a
+# Chrome trace (chrome://tracing or https://ui.perfetto.dev). Everything is
+# a no-op until enable() is called: span() hands back a shared null context
+# manager and hot call sites guard count() with "if profiling.enabled".
+#
+
+import os
+import json
+import time
+import functools
+import threading
+
+enabled = False
+
+_events = list()
+_counters = dict()
+
+def _now():
+    return time.perf_counter() * 1000000.0
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_span = _NullSpan()
+
+class _Span:
+    __slots__ = ('name', 'args', 'start', 'counters')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.counters = dict(_counters)
+        self.start = _now()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = _now()
+        args = dict(self.args)
+        for name, value in _counters.items():
+            delta = value - self.counters.get(name, 0)
+            if delta:
+                args[name] = delta
+        _events.append({'name': self.name, 'ph': 'X', 'ts': self.start,
+                        'dur': end - self.start, 'pid': os.getpid(),
+                        'tid': threading.current_thread().ident, 'args': args})
+        return False
+
+def span(name, **args):
+    """
+    Context manager timing one phase. Counters incremented inside the span
+    are recorded in its arguments.
+    """
+    if not enabled:
+        return _null_span
+    return _Span(name, args)
+
+def profiled(name=None):
+    "Decorator recording every call of a function as a span."
+    def decorate(function):
+        label = name or function.__name__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _Span(label, dict()):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, amount=1):
+    "Add to a named counter."
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    "Forget every recorded span and counter."
+    del _events[:]
+    _counters.clear()
+
+def events():
+    return list(_events)
+
+def counters():
+    return dict(_counters)
+
+def export_chrome_trace(filename):
+    "Write the recorded spans and final counter values as a Chrome trace."
+    trace = list(_events)
+    if _counters:
+        trace.append({'name': 'counters', 'ph': 'C', 'ts': _now(), 'pid': os.getpid(),
+                      'args': dict(_counters)})
+    with open(filename, "w") as out:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, out)
@@ -7,7 +7,7 @@ import networkx as nx
 import matplotlib.pyplot as plt
 
 from network import Network
-from joint_routing_channel_selection import select_channels, select_channels_greedy, rcs_path, vertices_for_path
+from joint_routing_channel_selection import select_channels, select_channels_greedy, route_many, vertices_for_path
 
 ITER = 1
 network = Network(number_of_nodes=10, width=50.0, height=50.0)
@@ -23,6 +23,9 @@ for i in range(ITER):
 		dst = random.choice(network.nodes())
 	paths.append((src, dst))
 
+# RCS paths for every pair at once, sharing the per-network setup
+rcs_paths = dict(zip(paths, route_many(network, paths)))
+
 for path in paths:
     src, dst = path
     print("\nSource: ", src, " Destination: ", dst)
@@ -42,7 +45,7 @@ for path in paths:
     print("\t\tThroughput = ", prim_throughput)
     prim_greedy_throughput = select_channels_greedy(network, prim_edges)
     print("\t\tThroughput Greedy = ", prim_greedy_throughput)
-    rcs_path = rcs_path(network, src, dst)
+    rcs_path = rcs_paths[path]
     print("\tRCS")
     if rcs_path is not None:
         print("\t\tPath: ", list(vertices_for_path(rcs_path.path)))
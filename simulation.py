@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# Time-Slotted Queue Simulation
+#
+
+import math
+import time
+import argparse
+
+import numpy
+
+import profiling
+from metrics import MetricsSink
+from network import Network
+from milp import get_backend
+from beam_scheduling import BeamSchedule, schedule_greedy, bsrap_problem, bsrap_solution
+
+SCHEDULERS = ('greedy1', 'greedy2', 'optimal')
+
+class Simulation:
+    """
+    Slotted evolution of the subscriber queues of a network. Every slot
+    traffic arrives at the subscribers, a beam scheduler picks who is
+    served and each served subscriber's queue drains by
+    min(ql, throughput * slot_length). Geometry and beamsets only enter
+    through one BeamSchedule, built once and reused every slot, and the
+    queues live in an array, so the Network is never touched while
+    running. Arrivals are Poisson with a mean of arrival_rate (bits per
+    second) * slot_length bits per subscriber and slot.
+    """
+
+    def __init__(self, network, scheduler='greedy1', arrival_rate=10 * math.pow(10,6),
+                 seed=None, backend=None, time_limit=None, mip_gap=None, schedule=None):
+        if scheduler not in SCHEDULERS:
+            raise ValueError("unknown scheduler %s" % scheduler)
+        self.network = network
+        self.scheduler = scheduler
+        self.arrival_rate = arrival_rate
+        self.backend = get_backend(backend) if scheduler == 'optimal' else None
+        self.time_limit = time_limit
+        self.mip_gap = mip_gap
+        self.schedule = schedule if schedule is not None else BeamSchedule(network)
+        self.queues = self.schedule.queue_lengths(network).astype(float)
+        if seed is None:
+            seed = network.seed
+        self.random = numpy.random.RandomState(seed % (1 << 32))
+        self.slot = 0
+
+    def arrivals(self):
+        "Bits arriving at every subscriber in one slot."
+        mean = self.arrival_rate * self.network.slot_length
+        return self.random.poisson(mean, len(self.queues)).astype(float)
+
+    def service(self, queues):
+        """
+        Bits the scheduler serves each subscriber in one slot, the
+        scheduling objective, the channels allocated at each relay and the
+        beamset index each relay points (-1 for none).
+        """
+        schedule = self.schedule
+        relays = len(schedule.relays)
+        if self.scheduler == 'optimal':
+            problem = bsrap_problem(schedule, queues)
+            solution = self.backend.solve(problem, time_limit=self.time_limit,
+                                          mip_gap=self.mip_gap)
+            if solution is None:
+                return (numpy.zeros(len(queues)), 0.0, numpy.zeros(relays, dtype=numpy.intp),
+                        numpy.full(relays, -1, dtype=numpy.intp))
+            preferred, served, chosen = bsrap_solution(schedule, solution.x)
+            allocated = numpy.bincount(preferred[preferred >= 0], minlength=relays)
+            return numpy.minimum(served, queues), solution.objective, allocated, chosen
+        service, objective, allocated, best = self._greedy(queues)
+        chosen = numpy.array([-1 if l is None else l for l, value in best], dtype=numpy.intp)
+        return service, objective, allocated, chosen
+
+    def _greedy(self, queues):
+        """
+        Greedy schedule of one slot: the bits served, the objective, the
+        allocated channels and the (beamset index, value) of every relay.
+        """
+        schedule = self.schedule
+        variant = 1 if self.scheduler == 'greedy1' else 2
+        objective, preferred, best, allocated, served = \
+            schedule_greedy(schedule, queues, variant=variant)
+        service = numpy.zeros(len(queues))
+        service[served] = numpy.minimum(queues[served], schedule.capacity[preferred[served], served])
+        return service, objective, allocated, best
+
+    def _advance(self):
+        "Advance one slot, timing the arrival, scheduling and drain phases."
+        start = time.perf_counter()
+        arrived = self.arrivals()
+        self.queues += arrived
+        scheduled = time.perf_counter()
+        service, objective, allocated, chosen = self.service(self.queues)
+        drained = time.perf_counter()
+        self.queues -= service
+        self.slot += 1
+        if profiling.enabled:
+            profiling.count('simulation.slots')
+        timings = (scheduled - start, drained - scheduled, time.perf_counter() - drained)
+        return arrived, service, objective, allocated, chosen, timings
+
+    def step(self):
+        "Advance one slot. Returns the bits arrived, served and the objective."
+        arrived, service, objective, allocated, chosen, timings = self._advance()
+        return arrived, service, objective
+
+    def records(self, slots):
+        """
+        Advance the given number of slots, yielding one metrics record per
+        slot: totals, the channels allocated at each relay, the bits served
+        to each subscriber, each relay's best_bearing (NaN for none) and
+        the wall time of each phase.
+        """
+        bearings = [numpy.append(numpy.asarray(b, dtype=float), numpy.nan)
+                    for b in self.schedule.bearings]
+        for t in range(slots):
+            arrived, service, objective, allocated, chosen, timings = self._advance()
+            yield {
+                'slot' : self.slot - 1,
+                'arrived' : float(arrived.sum()),
+                'served' : float(service.sum()),
+                'backlog' : float(self.queues.sum()),
+                'objective' : objective,
+                'allocated_channels' : allocated,
+                'served_bits' : service,
+                'best_bearing' : numpy.array([bearings[i][l] for i, l in enumerate(chosen.tolist())]),
+                'arrival_time' : timings[0],
+                'schedule_time' : timings[1],
+                'drain_time' : timings[2],
+            }
+
+    def run(self, slots, block=4096):
+        """
+        Advance the given number of slots. Returns a dict of per-slot
+        arrays: total bits 'arrived' and 'served', the 'backlog' left
+        queued at the end of the slot and the scheduler's 'objective'.
+        Arrivals are drawn block slots at a time, which yields the same
+        values as drawing them slot by slot; only scheduling and the
+        queue update stay in the per-slot loop, since each slot's
+        schedule depends on the queues the previous one left. A greedy
+        slot is a few dozen numpy calls on relay x subscriber arrays: on
+        the default 30 node, 6 relay network one core manages roughly
+        4,500 to 6,000 slots a second with greedy1 and 6,000 to 8,000
+        with greedy2, so 100k slots take 15 to 22 s. The simulation phase
+        of benchmarks.py tracks it.
+        """
+        history = dict((name, numpy.zeros(slots))
+                       for name in ('arrived', 'served', 'backlog', 'objective'))
+        mean = self.arrival_rate * self.network.slot_length
+        queues = self.queues
+        schedule = self.service if self.scheduler == 'optimal' else self._greedy
+        with profiling.span('simulation.run', scheduler=self.scheduler, slots=slots):
+            for first in range(0, slots, block):
+                arrivals = self.random.poisson(mean, (min(block, slots - first), len(queues)))
+                arrivals = arrivals.astype(float)
+                history['arrived'][first:first + len(arrivals)] = arrivals.sum(axis=1)
+                for t, arrived in enumerate(arrivals, first):
+                    queues += arrived
+                    service, objective, allocated, best = schedule(queues)
+                    queues -= service
+                    history['served'][t] = service.sum()
+                    history['backlog'][t] = queues.sum()
+                    history['objective'][t] = objective
+        self.slot += slots
+        profiling.count('simulation.slots', slots)
+        return history
+
+    def sync(self):
+        "Write the simulated queue lengths back to the network's subscribers."
+        for s, queue_length in zip(self.schedule.subscribers, self.queues.tolist()):
+            self.network.node[s]['queue_length'] = queue_length
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate slotted beam scheduling.")
+    parser.add_argument("--nodes", type=int, default=30)
+    parser.add_argument("--relays", type=int, default=6)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--width", type=float, default=20.0)
+    parser.add_argument("--height", type=float, default=20.0)
+    parser.add_argument("--slots", type=int, default=10000)
+    parser.add_argument("--scheduler", default='greedy1', choices=SCHEDULERS)
+    parser.add_argument("--arrival-rate", type=float, default=10 * math.pow(10,6),
+                        help="mean bits per second arriving at each subscriber")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--metrics", default=None,
+                        help="directory to stream per-slot metrics chunks into")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--overwrite", action="store_true",
+                        help="replace the chunks of an earlier run in the metrics directory")
+    args = parser.parse_args(argv)
+
+    network = Network(seed=args.seed, number_of_nodes=args.nodes, relays=args.relays,
+                      channels=args.channels, width=args.width, height=args.height)
+    network.beamsets()
+    simulation = Simulation(network, args.scheduler, args.arrival_rate, seed=args.seed)
+    seconds = args.slots * network.slot_length
+    if args.metrics is None:
+        history = simulation.run(args.slots)
+        arrived = history['arrived'].sum()
+        served = history['served'].sum()
+    else:
+        with MetricsSink(args.metrics, chunk_size=args.chunk_size,
+                         overwrite=args.overwrite) as sink:
+            sink.consume(simulation.records(args.slots))
+            summary = sink.summary()
+        arrived = summary['arrived']['mean'] * args.slots
+        served = summary['served']['mean'] * args.slots
+        backlog = summary['backlog']
+        print("Backlog: mean %0.0f, p50 %0.0f, p99 %0.0f bits" %
+              (backlog['mean'], backlog['p50'], backlog['p99']))
+    print("Slots: %d (%0.2f s)" % (args.slots, seconds))
+    print("Offered: %0.2f mbps" % (arrived / seconds / math.pow(10,6)))
+    print("Served: %0.2f mbps" % (served / seconds / math.pow(10,6)))
+    print("Final backlog: %0.0f bits" % simulation.queues.sum())
+
+if __name__ == "__main__":
+    main()
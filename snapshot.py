@@ -0,0 +1,228 @@
+#
+# Binary Network Snapshots
+#
+# A snapshot is a directory of raw .npy arrays plus a small JSON header.
+# It holds everything needed to pick a generated network back up without
+# regenerating it: positions, node attributes, edges, channel capacities,
+# primary interference, the link interference graph and beamsets. Arrays
+# are memory-mapped copy-on-write on load, so a large scenario saved once
+# is cheap to reopen for every algorithm run.
+#
+
+import os
+import json
+import itertools
+from collections import defaultdict
+
+import numpy
+import networkx
+import scipy.sparse
+
+from channels import ChannelStore, ChannelView, edge_key
+from interference import InterferenceGraph
+from network import Network, EdgeData, Geometry, ThroughputAccountant
+
+FORMAT = 2
+
+# Stands in for a node attribute that a node does not have
+_missing = {'missing': True}
+
+def _encode(value):
+    "JSON form of a node attribute that is not a plain number."
+    if isinstance(value, (set, frozenset)):
+        return {'set': sorted(_encode(v) for v in value)}
+    if isinstance(value, tuple):
+        return {'tuple': [_encode(v) for v in value]}
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+def _decode(value):
+    if isinstance(value, dict) and 'set' in value:
+        return set(_decode(v) for v in value['set'])
+    if isinstance(value, dict) and 'tuple' in value:
+        return tuple(_decode(v) for v in value['tuple'])
+    return value
+
+def _numeric(values):
+    "True when a node attribute can be stored as one array without changing type."
+    kinds = set(type(v) for v in values)
+    return len(kinds) == 1 and kinds.pop() in (bool, int, float)
+
+def save(network, directory):
+    "Write a snapshot of network into directory, creating it if needed."
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    def put(name, array):
+        numpy.save(os.path.join(directory, name + '.npy'), numpy.asarray(array))
+
+    # Nodes and neighbours keep the graph's iteration order, which
+    # tie-breaking and random choices in the algorithms depend on
+    nodes = network.nodes()
+    put('nodes', numpy.array(nodes, dtype=numpy.intp))
+    put('adjacency_indptr', numpy.cumsum([0] + [len(network.adj[n]) for n in nodes]))
+    put('adjacency_indices', numpy.fromiter(itertools.chain.from_iterable(
+        network.adj[n] for n in nodes), dtype=numpy.intp))
+    put('positions', network.geometry.positions)
+    put('receiver_gain', network.geometry.receiver_gain)
+    put('blocked', network.blocked)
+
+    names = sorted(set(name for n in nodes for name in network.node[n]))
+    node_arrays = list()
+    node_objects = dict()
+    for name in names:
+        values = [network.node[n].get(name, _missing) for n in nodes]
+        if _numeric(values):
+            put('node_' + name, values)
+            node_arrays.append(name)
+        else:
+            node_objects[name] = [_encode(v) for v in values]
+
+    edges = numpy.array([edge_key(u, v) for u, v in network.edges()],
+                        dtype=numpy.intp).reshape(-1, 2)
+    put('edges', edges)
+    put('distance', [network.adj[u][v]['distance'] for u, v in edges.tolist()])
+    put('capacities', network.channel_capacities(edges).astype(numpy.float32))
+    throughput = [network.accountant.edges[key] for key in map(tuple, edges.tolist())]
+    put('throughput', numpy.array(throughput, dtype=float).reshape(-1, 2))
+
+    interference = network.interference
+    if interference is not None:
+        put('interference_edges', numpy.array(interference.edges, dtype=numpy.intp).reshape(-1, 2))
+        put('interference_available', interference.available)
+        for freq, neighbours in interference.neighbours.items():
+            f = interference.frequency_index[freq]
+            put('interference_%d_indptr' % f, neighbours.indptr)
+            put('interference_%d_indices' % f, neighbours.indices)
+
+    # Beamsets keep their dict order, which fixes beamset indices and ties
+    beams = [(relay, bearing) for relay in network.beamset
+             for bearing in network.beamset[relay]]
+    members = [sorted(network.beamset[relay][bearing]) for relay, bearing in beams]
+    put('beam_relays', numpy.array([relay for relay, bearing in beams], dtype=numpy.intp))
+    put('beam_bearings', numpy.array([bearing for relay, bearing in beams], dtype=float))
+    put('beam_intervals', numpy.array([network.beam_interval[relay].get(bearing, (0.0, 0.0))
+                                       for relay, bearing in beams], dtype=float).reshape(-1, 2))
+    put('beam_indptr', numpy.cumsum([0] + [len(m) for m in members]))
+    put('beam_members', numpy.fromiter(itertools.chain.from_iterable(members), dtype=numpy.intp))
+
+    attributes = dict((name, value) for name, value in vars(network).items()
+                      if isinstance(value, (bool, int, float, str)))
+    header = {
+        'format': FORMAT,
+        'attributes': attributes,
+        'graph': network.graph,
+        'compact': network.channel_store is not None,
+        'relays': list(network.relay_order),
+        'subscribers': sorted(network.subscribers),
+        'beamset_relays': list(network.beamset),
+        'node_arrays': node_arrays,
+        'node_objects': node_objects,
+        'total_throughput': network.accountant.total,
+        'interference': None if interference is None else
+            [interference.frequency_index[freq] for freq in interference.neighbours],
+    }
+    with open(os.path.join(directory, 'header.json'), 'w') as out:
+        json.dump(header, out)
+
+def load(directory, mmap=True):
+    """
+    Read a network back from a snapshot directory. With mmap=True the
+    arrays are memory-mapped copy-on-write instead of read into memory.
+    """
+    with open(os.path.join(directory, 'header.json')) as f:
+        header = json.load(f)
+    if header['format'] != FORMAT:
+        raise ValueError("unsupported snapshot format %s" % header['format'])
+    mode = 'c' if mmap else None
+
+    def get(name):
+        return numpy.load(os.path.join(directory, name + '.npy'), mmap_mode=mode)
+
+    network = Network.__new__(Network)
+    networkx.graph.Graph.__init__(network, **header['graph'])
+    for name, value in header['attributes'].items():
+        setattr(network, name, value)
+    channels = network.channels
+    frequencies = Network.FREQUENCIES
+
+    positions = get('positions')
+    network.geometry = Geometry(positions, get('receiver_gain'), dense=not network.sparse)
+    network.position = dict((n, (x, y)) for n, (x, y) in enumerate(positions.tolist()))
+    network.blocked = get('blocked')
+    # A set's iteration order depends on the order its members were added
+    # in, so the sets are rebuilt the way the constructor built them:
+    # relays in the order they were picked, subscribers in node order
+    network.relay_order = list(header['relays'])
+    network.relays = set()
+    for relay in network.relay_order:
+        network.relays.add(relay)
+    network.subscribers = set()
+    for subscriber in header['subscribers']:
+        network.subscribers.add(subscriber)
+    network.channel_store = None
+    network._materialized = set()
+
+    nodes = get('nodes').tolist()
+    columns = dict((name, get('node_' + name).tolist()) for name in header['node_arrays'])
+    for name, values in header['node_objects'].items():
+        columns[name] = [_decode(value) for value in values]
+    for k, n in enumerate(nodes):
+        network.node[n] = dict((name, values[k]) for name, values in columns.items()
+                               if values[k] != _missing)
+        network.adj[n] = dict()
+
+    edges = get('edges')
+    keys = [tuple(edge) for edge in edges.tolist()]
+    if header['compact']:
+        store = ChannelStore(frequencies, channels, capacity=1)
+        store.capacities = get('capacities')
+        store.size = len(keys)
+        store.index = dict(zip(keys, range(len(keys))))
+        network.channel_store = store
+        network._materialized = set(keys)
+    data = dict()
+    for row, ((u, v), distance) in enumerate(zip(keys, get('distance').tolist())):
+        e = EdgeData(network, u, v, distance=distance)
+        if network.channel_store is not None:
+            e['channels'] = ChannelView(network.channel_store, row)
+        data[(u, v)] = e
+    indptr = get('adjacency_indptr').tolist()
+    indices = get('adjacency_indices').tolist()
+    for k, n in enumerate(nodes):
+        adjacency = network.adj[n]
+        for neighbor in indices[indptr[k]:indptr[k + 1]]:
+            adjacency[neighbor] = data[edge_key(n, neighbor)]
+
+    network.accountant = ThroughputAccountant(network)
+    throughput = get('throughput').tolist()
+    network.accountant.edges = dict(zip(keys, map(tuple, throughput)))
+    network.accountant.total = header['total_throughput']
+
+    network.interference = None
+    if header['interference'] is not None:
+        edges = get('interference_edges').tolist()
+        neighbours = dict()
+        for f in header['interference']:
+            indptr = get('interference_%d_indptr' % f)
+            indices = get('interference_%d_indices' % f)
+            neighbours[frequencies[f]] = scipy.sparse.csr_matrix(
+                (numpy.ones(len(indices), dtype=bool), indices, indptr),
+                shape=(len(edges), len(edges)))
+        network.interference = InterferenceGraph.from_arrays(
+            frequencies, channels, edges, get('interference_available'), neighbours)
+
+    network.beamset = defaultdict(lambda: defaultdict(dict))
+    network.beam_interval = defaultdict(dict)
+    for relay in header['beamset_relays']:
+        network.beamset[relay]
+        network.beam_interval[relay]
+    indptr = get('beam_indptr').tolist()
+    members = get('beam_members').tolist()
+    intervals = get('beam_intervals').tolist()
+    for k, (relay, bearing) in enumerate(zip(get('beam_relays').tolist(),
+                                             get('beam_bearings').tolist())):
+        network.beamset[relay][bearing] = set(members[indptr[k]:indptr[k + 1]])
+        network.beam_interval[relay][bearing] = tuple(intervals[k])
+    return network
@@ -0,0 +1,77 @@
+#
+# Link interference graph and per-path oracle
+#
+
+import random
+import itertools
+
+import numpy
+import pytest
+
+from network import Network, signal_range
+from interference import InterferenceOracle
+
+def build(seed):
+    random.seed(seed)
+    numpy.random.seed(seed)
+    network = Network(seed=seed, number_of_nodes=25, relays=3, channels=2)
+    network.prune_dead_edges()
+    network.build_interference()
+    return network
+
+def walk(network, hops):
+    "A random simple path of at most hops edges."
+    nodes = [random.choice(network.nodes())]
+    while len(nodes) <= hops:
+        following = [v for v in network.neighbors(nodes[-1]) if v not in nodes]
+        if not following:
+            break
+        nodes.append(random.choice(following))
+    return list(zip(nodes[:-1], nodes[1:]))
+
+def largest_clique(conflict, loc, members):
+    "Brute force size of the largest mutually conflicting set with loc in members."
+    others = [j for j in members if j != loc]
+    for size in range(len(others), -1, -1):
+        for subset in itertools.combinations(others, size):
+            clique = (loc,) + subset
+            if all(conflict(a, b) for a, b in itertools.combinations(clique, 2)):
+                return size + 1
+
+def pairs(network):
+    return [(freq, channel) for freq in network.FREQUENCIES for channel in range(network.channels)]
+
+@pytest.mark.parametrize("seed", range(1, 4))
+def test_graph_matches_definition(seed):
+    network = build(seed)
+    graph = network.interference
+    edges = random.Random(seed).sample(graph.edges, min(40, len(graph.edges)))
+    for (a, b), (c, d) in itertools.combinations(edges, 2):
+        for freq, channel in pairs(network):
+            f = graph.frequency_index[freq]
+            available = graph.available[graph.index[(a, b)], f, channel] and \
+                graph.available[graph.index[(c, d)], f, channel]
+            close = set((a, b)) & set((c, d)) or (freq in signal_range and any(
+                network.geometry.distance(u, v) < signal_range[freq] for u in (a, b) for v in (c, d)))
+            assert graph.interferes((a, b), (c, d), freq, channel) == bool(available and close)
+
+@pytest.mark.parametrize("seed", range(1, 6))
+def test_oracle_matches_graph(seed):
+    network = build(seed)
+    graph = network.interference
+    for trial in range(10):
+        path = walk(network, 6)
+        oracle = InterferenceOracle(network, path)
+        hops = range(len(path))
+        for freq, channel in pairs(network):
+            def conflict(i, j):
+                return graph.interferes(path[i], path[j], freq, channel)
+            for i, j in itertools.product(hops, hops):
+                assert oracle.interferes(i, j, freq, channel) == (i != j and conflict(i, j))
+            bit = oracle.bit(freq, channel)
+            for loc in hops:
+                for size in range(len(path) + 1):
+                    for members in itertools.combinations(hops, size):
+                        mask = sum(1 << j for j in members) | 1 << loc
+                        expected = largest_clique(conflict, loc, set(members) | set([loc]))
+                        assert oracle.clique(bit, loc, mask) == expected
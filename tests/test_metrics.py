@@ -0,0 +1,34 @@
+#
+# Streaming metrics
+#
+
+import os
+import json
+
+import numpy
+import pytest
+
+from metrics import MetricsSink, load
+
+def write(directory, rows, **kwargs):
+    with MetricsSink(str(directory), chunk_size=4, **kwargs) as sink:
+        sink.consume({'slot': t, 'served': numpy.arange(3) * t} for t in range(rows))
+
+def test_round_trip(tmp_path):
+    write(tmp_path, 10)
+    columns = load(str(tmp_path))
+    assert columns['slot'].tolist() == list(range(10))
+    assert columns['served'].shape == (10, 3)
+    with open(os.path.join(str(tmp_path), "summary.json")) as summary:
+        assert json.load(summary)['chunks'] == 3
+
+def test_refuses_earlier_chunks(tmp_path):
+    write(tmp_path, 10)
+    with pytest.raises(ValueError):
+        write(tmp_path, 2)
+    assert load(str(tmp_path))['slot'].tolist() == list(range(10))
+
+def test_overwrite_replaces_earlier_chunks(tmp_path):
+    write(tmp_path, 10)
+    write(tmp_path, 2, overwrite=True)
+    assert load(str(tmp_path))['slot'].tolist() == [0, 1]
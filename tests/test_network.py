@@ -0,0 +1,87 @@
+#
+# Network construction
+#
+
+import os
+import sys
+import math
+import random
+import subprocess
+
+import numpy
+import pytest
+from matplotlib.collections import LineCollection
+
+from network import Network
+
+def build(seed, **kwargs):
+    random.seed(seed)
+    numpy.random.seed(seed)
+    return Network(seed=seed, number_of_nodes=40, relays=4, **kwargs)
+
+def edge_set(network):
+    return set(tuple(sorted(edge)) for edge in network.edges())
+
+@pytest.mark.parametrize("seed", range(1, 9))
+def test_sparse_matches_dense(seed):
+    dense = build(seed)
+    sparse = build(seed, sparse=True)
+    skeleton = set((0, relay) for relay in dense.relays)
+    viable = set(tuple(sorted(edge)) for edge in dense.edges()) - \
+        set(tuple(sorted(edge)) for edge in dense.dead_edges())
+    assert edge_set(sparse) == viable | skeleton
+
+@pytest.mark.parametrize("seed", range(1, 9))
+def test_sparse_radial_matches_dense_radial(seed):
+    dense = build(seed, radial=True)
+    sparse = build(seed, radial=True, sparse=True)
+    assert edge_set(sparse) == edge_set(dense)
+    assert edge_set(dense) == set((0, relay) for relay in dense.relays)
+    assert sparse.update_node_throughput() == pytest.approx(dense.update_node_throughput())
+
+@pytest.mark.parametrize("seed", range(1, 5))
+def test_throughput_accounting_follows_bulk_mutators(seed):
+    network = build(seed)
+    def fresh():
+        total = network.update_node_throughput()
+        nodes = [network.node[n]['throughput'] for n in network.nodes()]
+        network.accountant.rebuild()
+        assert total == pytest.approx(network.update_node_throughput())
+        assert nodes == pytest.approx([network.node[n]['throughput'] for n in network.nodes()])
+    network.remove_edges_from(network.edges()[:50])
+    fresh()
+    network.add_edges_from([(1, 2), (3, 4), (1, 2)])
+    fresh()
+    network.remove_nodes_from([5, 6, 1000])
+    fresh()
+    network.clear()
+    assert network.update_node_throughput() == 0.0
+
+@pytest.mark.parametrize("extension", ["png", "svg"])
+def test_render_decimates_edges(tmp_path, extension):
+    network = build(1)
+    network.update_node_throughput()
+    edges = len(network.edges())
+    max_edges = edges // 3
+    filename = str(tmp_path / ("network." + extension))
+    figure = network.render(filename, max_edges=max_edges)
+    assert os.path.getsize(filename) > 0
+    lines = [c for c in figure.axes[0].collections if isinstance(c, LineCollection)]
+    assert len(lines) == 1
+    step = int(math.ceil(edges / float(max_edges)))
+    assert len(lines[0].get_segments()) == len(range(0, edges, step)) <= max_edges
+
+def test_render_does_not_import_pyplot(tmp_path):
+    # In a fresh interpreter, since anything else in the session may import it
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = "\n".join([
+        "import sys, random",
+        "sys.path.insert(0, %r)" % root,
+        "from network import Network",
+        "random.seed(1)",
+        "network = Network(seed=1, number_of_nodes=20, relays=2)",
+        "network.render(%r, max_edges=50)" % str(tmp_path / "network.png"),
+        "assert 'matplotlib.pyplot' not in sys.modules",
+    ])
+    subprocess.check_call([sys.executable, "-c", script])
+    assert os.path.getsize(str(tmp_path / "network.png")) > 0
@@ -0,0 +1,114 @@
+#
+# rcs_path() against exhaustive search over every simple path
+#
+
+import sys
+import random
+import itertools
+
+import numpy
+import networkx as nx
+import pytest
+
+from network import Network
+from joint_routing_channel_selection import rcs_path, route_many, select_channels, \
+    path_capacities, channel_options
+
+def make_network(seed, nodes=7, channels=1, keep=0.6, zero=0.4):
+    "A random subgraph of a complete network with random channel tables."
+    rng = random.Random(seed)
+    network = Network(seed=seed, number_of_nodes=nodes, relays=1, channels=channels)
+    network.remove_edges_from([e for e in network.edges() if rng.random() > keep])
+    for u, v in network.edges():
+        network[u][v]['channels'] = dict(
+            (freq, dict((c, 0.0 if rng.random() < zero else rng.choice((10.0, 20.0, 30.0, 45.0)))
+                        for c in range(channels)))
+            for freq in network.FREQUENCIES)
+    return network
+
+def full_channels(network, path):
+    "Throughput of a path when every hop uses all of its available pairs."
+    capacities = path_capacities(network, path)
+    masks = [sum(1 << b for b in numpy.flatnonzero(row > 0.0).tolist()) for row in capacities]
+    hops = len(path)
+    throughput = sys.float_info.max
+    for i in range(hops):
+        clique = 1.0 if hops == 1 else 2.0
+        if 1 < i < hops - 1 and masks[i - 1] & masks[i + 1]:
+            clique = 3.0
+        throughput = min(throughput, capacities[i].sum() / clique)
+    return throughput
+
+def exhaustive(network, src, dst, evaluate):
+    best = None
+    for nodes in nx.all_simple_paths(network, src, dst):
+        path = list(zip(nodes, nodes[1:]))
+        throughput = evaluate(network, path)
+        if throughput > 0.0 and (best is None or throughput > best):
+            best = throughput
+    return best
+
+def pairs(network):
+    nodes = sorted(network.nodes())
+    return [(s, d) for s in nodes for d in nodes if s < d]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_every_subset_matches_exhaustive(seed):
+    network = make_network(seed)
+    for src, dst in pairs(network):
+        best = exhaustive(network, src, dst, select_channels)
+        pcs = rcs_path(network, src, dst, consider=10**6, max_subset_size=None)
+        if best is None:
+            assert pcs is None or pcs.throughput == 0.0
+        else:
+            assert pcs is not None
+            assert pcs.throughput == pytest.approx(best)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_full_channels_matches_exhaustive(seed):
+    network = make_network(50 + seed, nodes=8, channels=2)
+    for src, dst in pairs(network):
+        best = exhaustive(network, src, dst, full_channels)
+        pcs = rcs_path(network, src, dst, consider=10**6, max_subset_size=0)
+        if best is None:
+            assert pcs is None or pcs.throughput == 0.0
+        else:
+            assert pcs is not None
+            assert pcs.throughput == pytest.approx(best)
+            assert full_channels(network, pcs.path) == pytest.approx(best)
+
+def test_route_many_matches_rcs_path():
+    network = make_network(99, nodes=8, channels=2)
+    routes = pairs(network)
+    expected = [rcs_path(network, s, d) for s, d in routes]
+    for pcs, reference in zip(route_many(network, routes, processes=1), expected):
+        assert (pcs is None) == (reference is None)
+        if pcs is not None:
+            assert pcs.path == reference.path
+            assert pcs.throughput == reference.throughput
+
+@pytest.mark.parametrize("max_size", [None, 1, 2, 3])
+def test_channel_options_enumerates_every_subset(max_size):
+    rng = random.Random(5)
+    for trial in range(50):
+        capacities = numpy.array([rng.choice((0.0, 10.0, 20.0, 45.0)) for b in range(6)])
+        available = [b for b in range(6) if capacities[b] > 0.0]
+        full = sum(1 << b for b in available)
+        expected = set([full] if available else [])
+        if available:
+            for size in range(1, len(available) + 1 if max_size is None else max_size + 1):
+                expected.update(sum(1 << b for b in subset)
+                                for subset in itertools.combinations(available, size))
+        options = channel_options(capacities, max_size)
+        assert set(mask for total, mask in options) == expected
+        assert len(options) == len(expected)
+        for total, mask in options:
+            assert total == pytest.approx(sum(capacities[b] for b in available if mask >> b & 1))
+        assert [total for total, mask in options] == sorted((t for t, m in options), reverse=True)
+
+def test_channel_options_refuses_unbounded_wide_masks():
+    capacities = numpy.full(24, 10.0)
+    with pytest.raises(ValueError):
+        channel_options(capacities, None)
+    assert len(channel_options(capacities, 2)) == 1 + 24 + 24 * 23 // 2
+    assert len(channel_options(numpy.full(12, 10.0), None)) == (1 << 12) - 1
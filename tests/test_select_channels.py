@@ -0,0 +1,70 @@
+#
+# select_channels() against brute force over every channel assignment
+#
+
+import sys
+import random
+import itertools
+
+import numpy
+import pytest
+
+from network import Network
+from joint_routing_channel_selection import select_channels, select_channels_greedy, \
+    path_capacities
+
+def make_path(seed, hops, channels, zero=0.4):
+    "A network with random channel tables on the path 0, 1, ..., hops."
+    rng = random.Random(seed)
+    network = Network(seed=seed, number_of_nodes=hops + 1, relays=1, channels=channels)
+    path = [(i, i + 1) for i in range(hops)]
+    for u, v in path:
+        network[u][v]['channels'] = dict(
+            (freq, dict((c, 0.0 if rng.random() < zero else rng.choice((10.0, 20.0, 30.0, 45.0)))
+                        for c in range(channels)))
+            for freq in network.FREQUENCIES)
+    return network, path
+
+def brute_force(network, path):
+    "Best bottleneck over every assignment of a pair subset to every hop."
+    capacities = path_capacities(network, path)
+    hops, pairs = capacities.shape
+    subsets = range(1 << pairs)
+    totals = [[sum(row[b] for b in range(pairs) if mask >> b & 1) for mask in subsets]
+              for row in capacities]
+    best = 0.0
+    for masks in itertools.product(subsets, repeat=hops):
+        throughput = sys.float_info.max
+        for i in range(hops):
+            clique = 1.0 if hops == 1 else 2.0
+            if 1 < i < hops - 1 and masks[i - 1] & masks[i + 1]:
+                clique = 3.0
+            throughput = min(throughput, totals[i][masks[i]] / clique)
+        best = max(best, throughput)
+    return best
+
+@pytest.mark.parametrize("seed", range(12))
+@pytest.mark.parametrize("hops", [1, 2, 3, 4, 5])
+def test_matches_brute_force_one_channel(seed, hops):
+    network, path = make_path(seed, hops, channels=1)
+    assert select_channels(network, path) == pytest.approx(brute_force(network, path))
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("hops", [2, 3])
+def test_matches_brute_force_two_channels(seed, hops):
+    network, path = make_path(100 + seed, hops, channels=2, zero=0.5)
+    assert select_channels(network, path) == pytest.approx(brute_force(network, path))
+
+@pytest.mark.parametrize("seed", range(12))
+def test_greedy_is_a_lower_bound(seed):
+    network, path = make_path(200 + seed, 5, channels=2)
+    assert select_channels_greedy(network, path) <= select_channels(network, path) + 1e-9
+
+def test_wide_paths_fall_back_to_greedy():
+    network, path = make_path(300, 4, channels=4, zero=0.0)
+    assert select_channels(network, path, max_pairs=6) == select_channels_greedy(network, path)
+
+def test_empty_path():
+    network, path = make_path(400, 1, channels=1)
+    assert select_channels(network, []) == 0.0
+    assert select_channels(network, None) == 0.0
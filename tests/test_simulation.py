@@ -0,0 +1,38 @@
+#
+# Slotted queue simulation
+#
+
+import random
+
+import numpy
+import pytest
+
+from network import Network
+from beam_scheduling import BeamSchedule
+from simulation import Simulation
+
+def build(seed):
+    random.seed(seed)
+    numpy.random.seed(seed)
+    network = Network(seed=seed, number_of_nodes=30, relays=6, channels=4)
+    network.beamsets()
+    return network
+
+@pytest.mark.parametrize("scheduler", ['greedy1', 'greedy2'])
+@pytest.mark.parametrize("seed", range(1, 4))
+def test_run_matches_step(seed, scheduler):
+    network = build(seed)
+    schedule = BeamSchedule(network)
+    batched = Simulation(network, scheduler, seed=seed, schedule=schedule)
+    stepped = Simulation(network, scheduler, seed=seed, schedule=schedule)
+    # A block smaller than the run exercises the block boundaries
+    history = batched.run(250, block=64)
+    for t in range(250):
+        arrived, service, objective = stepped.step()
+        assert history['arrived'][t] == arrived.sum()
+        assert history['served'][t] == service.sum()
+        assert history['backlog'][t] == stepped.queues.sum()
+        assert history['objective'][t] == objective
+    assert batched.slot == stepped.slot == 250
+    # Both leave the generator in the same state
+    assert numpy.array_equal(batched.step()[0], stepped.step()[0])
@@ -0,0 +1,52 @@
+#
+# Network snapshots
+#
+
+import random
+
+import numpy
+import pytest
+
+import snapshot
+from network import Network
+from beam_scheduling import greedy1, greedy2
+
+def build(seed, compact):
+    random.seed(seed)
+    numpy.random.seed(seed)
+    network = Network(seed=seed, number_of_nodes=60, relays=4, compact=compact)
+    network.prune_dead_edges()
+    network.build_interference()
+    network.beamsets()
+    return network
+
+def beamsets(network):
+    return [(relay, list(bearings.items())) for relay, bearings in network.beamset.items()]
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("seed", range(1, 7))
+def test_round_trip(tmp_path, seed, compact):
+    original = build(seed, compact)
+    snapshot.save(original, str(tmp_path))
+    loaded = snapshot.load(str(tmp_path))
+
+    assert list(loaded.relays) == list(original.relays)
+    assert list(loaded.subscribers) == list(original.subscribers)
+    assert loaded.edges() == original.edges()
+    edges = original.edges()
+    assert numpy.array_equal(loaded.channel_capacities(edges),
+                             original.channel_capacities(edges))
+
+    graph, copy = original.interference, loaded.interference
+    assert copy.edges == graph.edges
+    assert numpy.array_equal(copy.available, graph.available)
+    assert sorted(copy.neighbours) == sorted(graph.neighbours)
+    for freq in graph.neighbours:
+        assert (copy.neighbours[freq] != graph.neighbours[freq]).nnz == 0
+
+    assert beamsets(loaded) == beamsets(original)
+    assert loaded.beam_interval == original.beam_interval
+
+    # The heuristics change the network, so each one gets a fresh load
+    assert greedy1(snapshot.load(str(tmp_path))) == greedy1(build(seed, compact))
+    assert greedy2(snapshot.load(str(tmp_path))) == greedy2(build(seed, compact))